@@ -0,0 +1,59 @@
+# 响应压缩：按请求头 Accept-Encoding 协商，优先 brotli（需安装 brotli），其次 gzip
+# 只压缩超过 COMPRESS_MIN_SIZE 字节的 JSON/文本响应；流式导出不经过这里（响应体在发送时才生成）
+# 压缩后的 ETag 改为弱校验（内容语义相同、字节不同），Vary: Accept-Encoding 防止中间缓存混用
+from flask import current_app, request
+import gzip
+
+try:
+    import brotli
+except ImportError:  # 未安装 brotli 时只使用 gzip
+    brotli = None
+
+
+def _gzip(data, app):
+    return gzip.compress(data, compresslevel=app.config['COMPRESS_GZIP_LEVEL'], mtime=0)
+
+def _brotli(data, app):
+    return brotli.compress(data, quality=app.config['COMPRESS_BROTLI_QUALITY'])
+
+# 支持的编码，按优先顺序
+ENCODINGS = [('br', _brotli)] if brotli is not None else []
+ENCODINGS.append(('gzip', _gzip))
+
+
+def compress_response(response):
+    app = current_app
+    if (
+        response.status_code != 200
+        or response.direct_passthrough
+        or response.is_streamed
+        or 'Content-Encoding' in response.headers
+        or response.mimetype not in app.config['COMPRESS_MIMETYPES']
+    ):
+        return response
+
+    data = response.get_data()
+    if len(data) < app.config['COMPRESS_MIN_SIZE']:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = _negotiate(request.accept_encodings)
+    if not encoding:
+        return response
+
+    name, compress = encoding
+    response.set_data(compress(data, app))
+    response.headers['Content-Encoding'] = name
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+# 选出客户端接受的编码中质量值最高的一个（相同时按 ENCODINGS 的顺序），都不接受时返回 None
+def _negotiate(accept):
+    best, best_quality = None, 0
+    for name, compress in ENCODINGS:
+        quality = accept[name]
+        if quality > best_quality:
+            best, best_quality = (name, compress), quality
+    return best
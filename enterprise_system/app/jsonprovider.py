@@ -0,0 +1,66 @@
+# JSON 序列化：安装了 orjson 时由 orjson 编码（比标准库快数倍），否则使用标准库
+# 日期时间在这里统一转换为接口格式（日期时间 'YYYY-MM-DD HH:MM:SS'，日期 'YYYY-MM-DD'，时间 'HH:MM:SS'），
+# Decimal 转为浮点数；各接口的格式化函数直接返回数据库中的值，不再逐字段调用 strftime
+from flask.json.provider import DefaultJSONProvider
+from datetime import date, datetime, time
+from decimal import Decimal
+import json
+
+try:
+    import orjson
+except ImportError:  # 未安装 orjson 时使用标准库
+    orjson = None
+
+# 按类型查找转换函数（datetime 是 date 的子类，不能用 isinstance 依次判断）
+_CONVERTERS = {
+    datetime: lambda value: value.isoformat(' ', 'seconds'),
+    date: date.isoformat,
+    time: lambda value: value.isoformat('seconds'),
+    Decimal: float,
+}
+
+if orjson is not None:
+    # 日期时间交给 _default 按接口格式转换；允许非字符串的字典键（与标准库一致）
+    ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+
+# 把日期时间、Decimal 转换为接口中的格式，其他值原样返回（CSV 导出也使用）
+def format_value(value):
+    converter = _CONVERTERS.get(type(value))
+    return converter(value) if converter else value
+
+def _default(value):
+    converter = _CONVERTERS.get(type(value))
+    if converter is None:
+        raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+    return converter(value)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    ensure_ascii = False
+    sort_keys = False
+
+    def dumps(self, obj, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.dumps(obj, default=_default, option=ORJSON_OPTIONS).decode()
+        kwargs.setdefault('default', _default)
+        kwargs.setdefault('ensure_ascii', self.ensure_ascii)
+        return json.dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    # jsonify 使用：直接生成字节串，调试模式下缩进输出
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        option = ORJSON_OPTIONS
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            option |= orjson.OPT_INDENT_2
+        return self._app.response_class(
+            orjson.dumps(obj, default=_default, option=option) + b'\n',
+            mimetype=self.mimetype
+        )
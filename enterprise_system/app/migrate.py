@@ -0,0 +1,250 @@
+# 数据库结构迁移：按版本号依次执行，已执行的版本记录在 schema_migrations 表中
+# 用法：flask --app run migrate（在 enterprise_system 目录下执行）
+# 每个迁移都先检查当前结构再修改，可重复执行；新增迁移时在 MIGRATIONS 末尾追加，不要修改已发布的版本
+# database/init.sql 和 database/class_project.sql 是最新结构并已记录全部版本，新增迁移时同步修改这两个文件
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import text
+from app.models import db
+
+# 需要转换为 InnoDB 的表（原 class_project.sql 建表为 MyISAM，不支持事务和行锁）
+TABLES = [
+    'users', 'mails', 'notices', 'projects', 'project_members',
+    'reimbursements', 'leave_requests', 'attendance_records', 'work_logs'
+]
+
+
+# 辅助函数：索引是否存在
+def _index_exists(conn, table, name):
+    return conn.execute(text(
+        "SELECT COUNT(*) FROM information_schema.statistics "
+        "WHERE table_schema = DATABASE() AND table_name = :table AND index_name = :name"
+    ), {'table': table, 'name': name}).scalar() > 0
+
+# 辅助函数：列是否存在
+def _column_exists(conn, table, column):
+    return conn.execute(text(
+        "SELECT COUNT(*) FROM information_schema.columns "
+        "WHERE table_schema = DATABASE() AND table_name = :table AND column_name = :column"
+    ), {'table': table, 'column': column}).scalar() > 0
+
+# 辅助函数：不存在时添加索引；fulltext 为 True 时添加 ngram 分词的全文索引（支持中文）
+def _add_index(conn, table, name, columns, unique=False, fulltext=False):
+    if not _index_exists(conn, table, name):
+        kind = 'FULLTEXT INDEX' if fulltext else 'UNIQUE INDEX' if unique else 'INDEX'
+        parser = ' WITH PARSER ngram' if fulltext else ''
+        conn.execute(text(f"ALTER TABLE `{table}` ADD {kind} `{name}` ({', '.join(f'`{c}`' for c in columns)}){parser}"))
+
+# 辅助函数：按模型定义创建缺失的表
+def _create_tables(conn, *tables):
+    db.metadata.create_all(conn, tables=[db.metadata.tables[table] for table in tables])
+
+
+# 1. 所有表转换为 InnoDB
+def _convert_to_innodb(conn):
+    for table in TABLES:
+        engine = conn.execute(text(
+            "SELECT engine FROM information_schema.tables "
+            "WHERE table_schema = DATABASE() AND table_name = :table"
+        ), {'table': table}).scalar()
+        if engine and engine.lower() != 'innodb':
+            conn.execute(text(f"ALTER TABLE `{table}` ENGINE = InnoDB"))
+
+# 2. 高频查询的复合索引；考勤记录 (user_id, date) 唯一，先合并重复记录：
+# 保留 ID 最小的一条，签到取最早、签退取最晚，备注按 ID 顺序拼接；删除的记录原样备份到 attendance_records_merged
+def _add_composite_indexes(conn):
+    if not _index_exists(conn, 'attendance_records', 'uq_attendance_user_date'):
+        duplicates = conn.execute(text(
+            "SELECT COUNT(*) FROM attendance_records a JOIN attendance_records b "
+            "ON a.user_id = b.user_id AND a.date = b.date AND a.id > b.id"
+        )).scalar()
+        if duplicates:
+            conn.execute(text("CREATE TABLE IF NOT EXISTS attendance_records_merged LIKE attendance_records"))
+            conn.execute(text(
+                "INSERT IGNORE INTO attendance_records_merged SELECT a.* FROM attendance_records a "
+                "JOIN attendance_records b ON a.user_id = b.user_id AND a.date = b.date AND a.id > b.id"
+            ))
+            # GROUP_CONCAT 默认最多 1024 字节，超出部分会被截断
+            conn.execute(text("SET SESSION group_concat_max_len = 1048576"))
+            conn.execute(text(
+                "UPDATE attendance_records a JOIN ("
+                "  SELECT MIN(id) AS id, MIN(check_in) AS check_in, MAX(check_out) AS check_out,"
+                "  GROUP_CONCAT(note ORDER BY id SEPARATOR '；') AS note"
+                "  FROM attendance_records GROUP BY user_id, date HAVING COUNT(*) > 1"
+                ") d ON a.id = d.id SET a.check_in = d.check_in, a.check_out = d.check_out, a.note = d.note"
+            ))
+            conn.execute(text(
+                "DELETE a FROM attendance_records a JOIN attendance_records b "
+                "ON a.user_id = b.user_id AND a.date = b.date AND a.id > b.id"
+            ))
+        _add_index(conn, 'attendance_records', 'uq_attendance_user_date', ['user_id', 'date'], unique=True)
+    _add_index(conn, 'work_logs', 'idx_work_logs_user_date', ['user_id', 'log_date'])
+    _add_index(conn, 'mails', 'idx_mails_receiver_sent', ['receiver_id', 'sent_at'])
+    _add_index(conn, 'mails', 'idx_mails_sender_sent', ['sender_id', 'sent_at'])
+    _add_index(conn, 'leave_requests', 'idx_leave_status_submitted', ['status', 'submitted_at'])
+    _add_index(conn, 'reimbursements', 'idx_reimbursements_status_submitted', ['status', 'submitted_at'])
+
+# 3. JWT 吊销表
+def _create_revoked_tokens(conn):
+    _create_tables(conn, 'revoked_tokens')
+
+
+# 4. 考勤月度汇总表（建表后执行 flask --app run rebuild-summaries 填充历史数据）
+def _create_attendance_summaries(conn):
+    _create_tables(conn, 'attendance_summaries')
+
+
+# 5. 工作日志月度汇总表（建表后执行 flask --app run rebuild-summaries 填充历史数据）
+def _create_work_log_summaries(conn):
+    _create_tables(conn, 'work_log_summaries')
+
+
+# 6. 全文搜索索引：邮件主题和正文、公告标题和内容、工作日志内容
+def _add_fulltext_indexes(conn):
+    _add_index(conn, 'mails', 'ft_mails_subject_content', ['subject', 'content'], fulltext=True)
+    _add_index(conn, 'notices', 'ft_notices_title_content', ['title', 'content'], fulltext=True)
+    _add_index(conn, 'work_logs', 'ft_work_logs_content', ['content'], fulltext=True)
+
+
+# 7. 邮件计数表
+def _create_mail_counters(conn):
+    _create_tables(conn, 'mail_counters')
+
+
+# 8. 群发邮件：mail_broadcasts 表（含全文索引）和 mails.broadcast_id
+def _add_mail_broadcasts(conn):
+    _create_tables(conn, 'mail_broadcasts')
+    if not _column_exists(conn, 'mails', 'broadcast_id'):
+        conn.execute(text(
+            "ALTER TABLE `mails` ADD COLUMN `broadcast_id` INT NULL, "
+            "ADD CONSTRAINT `fk_mails_broadcast` FOREIGN KEY (`broadcast_id`) REFERENCES `mail_broadcasts` (`id`)"
+        ))
+
+
+# 9. 邮件会话：thread_id、parent_id；已有邮件各自作为独立会话（旧的回复邮件没有记录原邮件，无法可靠还原）
+def _add_mail_threads(conn):
+    if not _column_exists(conn, 'mails', 'thread_id'):
+        conn.execute(text(
+            "ALTER TABLE `mails` ADD COLUMN `thread_id` INT NULL, ADD COLUMN `parent_id` INT NULL, "
+            "ADD CONSTRAINT `fk_mails_parent` FOREIGN KEY (`parent_id`) REFERENCES `mails` (`id`)"
+        ))
+    conn.execute(text("UPDATE `mails` SET `thread_id` = `id` WHERE `thread_id` IS NULL"))
+    _add_index(conn, 'mails', 'idx_mails_thread', ['thread_id'])
+
+
+# 10. 公告摘要列，按原列表的规则（前 100 个字符）回填；公告列表按发布时间排序的索引
+def _add_notice_preview(conn):
+    if not _column_exists(conn, 'notices', 'preview'):
+        conn.execute(text("ALTER TABLE `notices` ADD COLUMN `preview` VARCHAR(120) NULL AFTER `content`"))
+    conn.execute(text(
+        "UPDATE `notices` SET `preview` = CASE WHEN CHAR_LENGTH(`content`) > 100 "
+        "THEN CONCAT(LEFT(`content`, 100), '...') ELSE `content` END WHERE `preview` IS NULL"
+    ))
+    _add_index(conn, 'notices', 'idx_notices_created', ['created_at'])
+
+
+# 11. 公告发布对象（已有公告保持全体可见）、已读记录表和未读计数表
+def _add_notice_audience(conn):
+    if not _column_exists(conn, 'notices', 'department'):
+        conn.execute(text(
+            "ALTER TABLE `notices` ADD COLUMN `department` VARCHAR(100) NULL AFTER `preview`, "
+            "ADD COLUMN `role` VARCHAR(20) NULL AFTER `department`"
+        ))
+    _create_tables(conn, 'notice_reads', 'notice_counters')
+
+
+# 12. users.password 加长以保存密码哈希（scrypt 哈希为 162 个字符）
+def _widen_password_column(conn):
+    length = conn.execute(text(
+        "SELECT character_maximum_length FROM information_schema.columns "
+        "WHERE table_schema = DATABASE() AND table_name = 'users' AND column_name = 'password'"
+    )).scalar()
+    if length < 255:
+        conn.execute(text("ALTER TABLE `users` MODIFY `password` VARCHAR(255) NOT NULL"))
+
+
+# 13. 游标分页排序键的索引（/leave/all、/reimbursement/all 不按状态筛选时按 (submitted_at, id) 排序，
+# /log/all 和日志导出按 (log_date, id) 排序）
+def _add_sort_key_indexes(conn):
+    _add_index(conn, 'work_logs', 'idx_work_logs_date_id', ['log_date', 'id'])
+    _add_index(conn, 'leave_requests', 'idx_leave_submitted_id', ['submitted_at', 'id'])
+    _add_index(conn, 'reimbursements', 'idx_reimbursements_submitted_id', ['submitted_at', 'id'])
+
+
+# 14. 邮件会话索引表，按已有邮件回填（发件人和收件人各一行，记录会话中最大的邮件ID）
+def _create_mail_thread_index(conn):
+    _create_tables(conn, 'mail_thread_index')
+    conn.execute(text(
+        "INSERT INTO `mail_thread_index` (`user_id`, `thread_id`, `last_mail_id`) "
+        "SELECT `user_id`, `thread_id`, MAX(`id`) FROM ("
+        "  SELECT `sender_id` AS `user_id`, `thread_id`, `id` FROM `mails` WHERE `sender_id` IS NOT NULL"
+        "  UNION ALL"
+        "  SELECT `receiver_id`, `thread_id`, `id` FROM `mails` WHERE `receiver_id` IS NOT NULL"
+        ") m GROUP BY `user_id`, `thread_id` "
+        "ON DUPLICATE KEY UPDATE `last_mail_id` = GREATEST(`mail_thread_index`.`last_mail_id`, VALUES(`last_mail_id`))"
+    ))
+
+
+# 15. 已结束月份考勤汇总的版本号表（部门汇总缓存跨进程失效）
+def _create_attendance_summary_versions(conn):
+    _create_tables(conn, 'attendance_summary_versions')
+
+
+# 迁移列表：(版本号, 说明, 执行函数)
+MIGRATIONS = [
+    (1, '所有表转换为 InnoDB', _convert_to_innodb),
+    (2, '添加复合索引和考勤唯一索引', _add_composite_indexes),
+    (3, '创建 revoked_tokens 表', _create_revoked_tokens),
+    (4, '创建 attendance_summaries 表', _create_attendance_summaries),
+    (5, '创建 work_log_summaries 表', _create_work_log_summaries),
+    (6, '添加全文搜索索引', _add_fulltext_indexes),
+    (7, '创建 mail_counters 表', _create_mail_counters),
+    (8, '创建 mail_broadcasts 表，mails 添加 broadcast_id', _add_mail_broadcasts),
+    (9, 'mails 添加 thread_id、parent_id', _add_mail_threads),
+    (10, 'notices 添加 preview 和发布时间索引', _add_notice_preview),
+    (11, 'notices 添加发布对象，创建 notice_reads、notice_counters 表', _add_notice_audience),
+    (12, 'users.password 加长为 VARCHAR(255)', _widen_password_column),
+    (13, '添加游标分页排序键索引', _add_sort_key_indexes),
+    (14, '创建 mail_thread_index 表并回填', _create_mail_thread_index),
+    (15, '创建 attendance_summary_versions 表', _create_attendance_summary_versions),
+]
+
+
+# 执行所有未执行的迁移，返回本次执行的版本号列表
+def run_migrations(engine):
+    if engine.dialect.name != 'mysql':
+        raise RuntimeError('迁移脚本仅支持 MySQL')
+
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "  version INT PRIMARY KEY,"
+            "  description VARCHAR(200),"
+            "  applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP"
+            ") ENGINE = InnoDB"
+        ))
+        applied = {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+    done = []
+    for version, description, migration in MIGRATIONS:
+        if version in applied:
+            continue
+        # MySQL 的 DDL 会隐式提交，每个迁移单独执行并记录
+        with engine.begin() as conn:
+            migration(conn)
+            conn.execute(text(
+                "INSERT INTO schema_migrations (version, description) VALUES (:version, :description)"
+            ), {'version': version, 'description': description})
+        done.append(version)
+    return done
+
+
+@click.command('migrate')
+@with_appcontext
+def migrate_command():
+    """执行数据库结构迁移"""
+    done = run_migrations(db.engine)
+    if done:
+        click.echo(f"已执行迁移：{', '.join(str(v) for v in done)}")
+    else:
+        click.echo('数据库结构已是最新')
@@ -1,13 +1,16 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+from app.replica import RoutingSession
 
-db = SQLAlchemy()
+# RoutingSession 负责把只读接口的查询路由到副本
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(db.Model):
     __tablename__ = 'users'
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(50), nullable=False, unique=True)
-    password = db.Column(db.String(100), nullable=False)
+    # 密码哈希（见 app/passwords.py），历史数据可能是明文，登录成功时转换
+    password = db.Column(db.String(255), nullable=False)
     email = db.Column(db.String(100), unique=True)
     department = db.Column(db.String(100))
     role = db.Column(db.Enum('employee', 'manager', 'admin'), default='employee')
@@ -17,8 +20,29 @@ class User(db.Model):
     sent_mails = db.relationship('Mail', backref='sender', foreign_keys='Mail.sender_id')
     received_mails = db.relationship('Mail', backref='receiver', foreign_keys='Mail.receiver_id')
 
+# 群发邮件：正文只保存一份，每个收件人一行 Mail（broadcast_id 指向此表，content 为空）
+class MailBroadcast(db.Model):
+    __tablename__ = 'mail_broadcasts'
+    __table_args__ = (
+        db.Index('ft_mail_broadcasts_subject_content', 'subject', 'content', mysql_prefix='FULLTEXT', mysql_with_parser='ngram'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    sender_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    subject = db.Column(db.String(200))
+    content = db.Column(db.Text)
+    department = db.Column(db.String(100))
+    role = db.Column(db.String(20))
+    recipient_count = db.Column(db.Integer, default=0)
+    sent_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 class Mail(db.Model):
     __tablename__ = 'mails'
+    __table_args__ = (
+        db.Index('idx_mails_receiver_sent', 'receiver_id', 'sent_at'),
+        db.Index('idx_mails_sender_sent', 'sender_id', 'sent_at'),
+        db.Index('idx_mails_thread', 'thread_id'),
+        db.Index('ft_mails_subject_content', 'subject', 'content', mysql_prefix='FULLTEXT', mysql_with_parser='ngram'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     sender_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     receiver_id = db.Column(db.Integer, db.ForeignKey('users.id'))
@@ -27,15 +51,59 @@ class Mail(db.Model):
     is_read = db.Column(db.Boolean, default=False)
     is_reply = db.Column(db.Boolean, default=False)
     sent_at = db.Column(db.DateTime, default=datetime.utcnow)
+    broadcast_id = db.Column(db.Integer, db.ForeignKey('mail_broadcasts.id'), nullable=True)
+    # 会话：thread_id 为会话第一封邮件的 ID（第一封邮件指向自己），parent_id 为被回复的邮件
+    thread_id = db.Column(db.Integer)
+    parent_id = db.Column(db.Integer, db.ForeignKey('mails.id'), nullable=True)
+
+# 邮件会话索引：每个用户参与的每个会话一行，记录会话中最新邮件的 ID，发信、回复、群发时在同一事务中更新
+# 按会话分组的收件箱按 (user_id, last_mail_id) 游标分页，不需要对整个邮箱分组
+class MailThreadIndex(db.Model):
+    __tablename__ = 'mail_thread_index'
+    __table_args__ = (
+        db.Index('idx_mail_thread_index_user_last', 'user_id', 'last_mail_id'),
+    )
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    thread_id = db.Column(db.Integer, primary_key=True)
+    last_mail_id = db.Column(db.Integer, nullable=False)
+
+# 邮件计数：每个用户的未读邮件数、已被回复的已发邮件数，随收发邮件增减
+# 计数行在首次读取时按邮件表初始化，删除计数行即可让其重新统计
+class MailCounter(db.Model):
+    __tablename__ = 'mail_counters'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    unread_count = db.Column(db.Integer, nullable=False, default=0)
+    replied_count = db.Column(db.Integer, nullable=False, default=0)
 
 class Notice(db.Model):
     __tablename__ = 'notices'
+    __table_args__ = (
+        db.Index('idx_notices_created', 'created_at'),
+        db.Index('ft_notices_title_content', 'title', 'content', mysql_prefix='FULLTEXT', mysql_with_parser='ngram'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200))
     content = db.Column(db.Text)
+    # 内容摘要，发布时生成，公告列表不读取完整内容
+    preview = db.Column(db.String(120))
+    # 发布对象：部门、角色，均为空表示全体；同时指定时取交集
+    department = db.Column(db.String(100))
+    role = db.Column(db.String(20))
     created_by = db.Column(db.Integer, db.ForeignKey('users.id'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+# 公告已读记录，只保存用户和公告的ID
+class NoticeRead(db.Model):
+    __tablename__ = 'notice_reads'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    notice_id = db.Column(db.Integer, db.ForeignKey('notices.id'), primary_key=True)
+
+# 每个用户的未读公告数，发布、阅读、删除公告时增减
+class NoticeCounter(db.Model):
+    __tablename__ = 'notice_counters'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    unread_count = db.Column(db.Integer, nullable=False, default=0)
+
 class Project(db.Model):
     __tablename__ = 'projects'
     id = db.Column(db.Integer, primary_key=True)
@@ -55,6 +123,10 @@ class ProjectMember(db.Model):
 
 class Reimbursement(db.Model):
     __tablename__ = 'reimbursements'
+    __table_args__ = (
+        db.Index('idx_reimbursements_status_submitted', 'status', 'submitted_at'),
+        db.Index('idx_reimbursements_submitted_id', 'submitted_at', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     project_id = db.Column(db.Integer, db.ForeignKey('projects.id'))
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
@@ -67,6 +139,10 @@ class Reimbursement(db.Model):
 
 class LeaveRequest(db.Model):
     __tablename__ = 'leave_requests'
+    __table_args__ = (
+        db.Index('idx_leave_status_submitted', 'status', 'submitted_at'),
+        db.Index('idx_leave_submitted_id', 'submitted_at', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     leave_type = db.Column(db.String(50))
@@ -80,6 +156,9 @@ class LeaveRequest(db.Model):
 
 class AttendanceRecord(db.Model):
     __tablename__ = 'attendance_records'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'date', name='uq_attendance_user_date'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     date = db.Column(db.Date)
@@ -89,9 +168,65 @@ class AttendanceRecord(db.Model):
 
 class WorkLog(db.Model):
     __tablename__ = 'work_logs'
+    __table_args__ = (
+        db.Index('idx_work_logs_user_date', 'user_id', 'log_date'),
+        db.Index('idx_work_logs_date_id', 'log_date', 'id'),
+        db.Index('ft_work_logs_content', 'content', mysql_prefix='FULLTEXT', mysql_with_parser='ngram'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     log_date = db.Column(db.Date)
     duration_hours = db.Column(db.Numeric(4, 2))
     content = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# 考勤月度汇总：每人每月一行，由考勤明细计算（见 app/summaries.py）
+class AttendanceSummary(db.Model):
+    __tablename__ = 'attendance_summaries'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'year', 'month', name='uq_attendance_summary_user_month'),
+        db.Index('idx_attendance_summary_month', 'year', 'month'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    year = db.Column(db.SmallInteger, nullable=False)
+    month = db.Column(db.SmallInteger, nullable=False)
+    present_days = db.Column(db.Integer, default=0)
+    normal_days = db.Column(db.Integer, default=0)
+    late_days = db.Column(db.Integer, default=0)
+    early_days = db.Column(db.Integer, default=0)
+    late_early_days = db.Column(db.Integer, default=0)
+    absent_days = db.Column(db.Integer, default=0)
+    noted_days = db.Column(db.Integer, default=0)
+    first_check_in = db.Column(db.Time)
+    last_check_out = db.Column(db.Time)
+    avg_check_in = db.Column(db.Time)
+    avg_check_out = db.Column(db.Time)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# 已结束月份考勤汇总的版本号：补录已结束月份的考勤时在同一事务中加一，各进程据此判断部门汇总缓存是否过期
+class AttendanceSummaryVersion(db.Model):
+    __tablename__ = 'attendance_summary_versions'
+    year = db.Column(db.SmallInteger, primary_key=True)
+    month = db.Column(db.SmallInteger, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+# 工作日志月度汇总：每人每月的总时长和日志数（见 app/summaries.py）
+class WorkLogSummary(db.Model):
+    __tablename__ = 'work_log_summaries'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'year', 'month', name='uq_work_log_summary_user_month'),
+        db.Index('idx_work_log_summary_month', 'year', 'month'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    year = db.Column(db.SmallInteger, nullable=False)
+    month = db.Column(db.SmallInteger, nullable=False)
+    total_hours = db.Column(db.Numeric(8, 2), default=0)
+    log_count = db.Column(db.Integer, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class RevokedToken(db.Model):
+    __tablename__ = 'revoked_tokens'
+    jti = db.Column(db.String(32), primary_key=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
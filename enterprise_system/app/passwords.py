@@ -0,0 +1,109 @@
+# 密码哈希：使用 werkzeug 的哈希格式（如 scrypt:32768:8:1$盐$摘要），算法和成本参数由 PASSWORD_HASH_METHOD 配置
+# 历史数据中的明文密码、以及按旧参数生成的哈希，在用户下次登录成功时按当前参数重新生成
+# 哈希计算很耗 CPU（scrypt 还需要数十 MB 内存），在每个进程内固定大小的线程池中执行，
+# 同时计算的数量不超过 PASSWORD_HASH_WORKERS，排队超过 PASSWORD_HASH_QUEUE 时直接拒绝，避免请求线程全部卡在哈希上
+import click
+from flask import current_app, jsonify
+from flask.cli import with_appcontext
+from werkzeug.security import generate_password_hash, check_password_hash
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import hmac
+import re
+import threading
+
+# werkzeug 哈希格式：方法$盐$摘要
+_HASH_PATTERN = re.compile(r'^(?:scrypt|pbkdf2):[\w:]+\$[^$]+\$[0-9a-f]+$')
+
+_executor = None
+_slots = None
+_lock = threading.Lock()
+# 用户不存在时用于校验的哈希，使响应时间与用户存在时一致
+_dummy_hash = None
+
+
+# 哈希计算繁忙（排队已满或等待超时），由 busy_response 转换为 503 响应
+class PasswordHashBusy(Exception):
+    pass
+
+def busy_response(error):
+    return jsonify({'status': 'error', 'message': '登录人数较多，请稍后重试'}), 503, {'Retry-After': '1'}
+
+
+def is_hashed(stored):
+    return bool(stored) and _HASH_PATTERN.match(stored) is not None
+
+# 生成密码哈希（在线程池中计算）
+def hash_password(password):
+    method = current_app.config['PASSWORD_HASH_METHOD']
+    return _run(generate_password_hash, password, method)
+
+# 校验密码（在线程池中计算），返回 (是否正确, 需要更新时的新哈希或 None)
+# stored 为 None 时（用户不存在）与一个固定的哈希比较，结果总是 False
+def verify_password(stored, password):
+    method = current_app.config['PASSWORD_HASH_METHOD']
+    if stored is None:
+        _run(check_password_hash, _get_dummy_hash(method), password)
+        return False, None
+    return _run(_verify, stored, password, method)
+
+def _verify(stored, password, method):
+    if not is_hashed(stored):
+        # 历史明文密码
+        if not hmac.compare_digest(stored.encode(), password.encode()):
+            return False, None
+        return True, generate_password_hash(password, method)
+    if not check_password_hash(stored, password):
+        return False, None
+    if stored.split('$', 1)[0] != method:
+        return True, generate_password_hash(password, method)
+    return True, None
+
+def _get_dummy_hash(method):
+    global _dummy_hash
+    if _dummy_hash is None or not _dummy_hash.startswith(method + '$'):
+        _dummy_hash = _run(generate_password_hash, 'dummy-password', method)
+    return _dummy_hash
+
+
+# 在线程池中执行并等待结果；线程池在首次使用时创建（gunicorn preload_app 时 fork 之后才创建线程）
+def _run(func, *args):
+    config = current_app.config
+    executor, slots = _get_executor(config['PASSWORD_HASH_WORKERS'], config['PASSWORD_HASH_QUEUE'])
+    if not slots.acquire(blocking=False):
+        raise PasswordHashBusy()
+    try:
+        future = executor.submit(func, *args)
+    except BaseException:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+    try:
+        return future.result(timeout=config['PASSWORD_HASH_TIMEOUT'])
+    except TimeoutError:
+        future.cancel()
+        raise PasswordHashBusy()
+
+def _get_executor(workers, queue):
+    global _executor, _slots
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _slots = threading.BoundedSemaphore(workers + queue)
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+    return _executor, _slots
+
+
+@click.command('hash-passwords')
+@with_appcontext
+def hash_passwords_command():
+    """把仍以明文保存的密码转换为哈希（不必等用户登录）"""
+    from app.models import db, User
+    method = current_app.config['PASSWORD_HASH_METHOD']
+    count = 0
+    candidates = User.query.filter(~User.password.like('scrypt:%'), ~User.password.like('pbkdf2:%'))
+    for user in candidates:
+        if not is_hashed(user.password):
+            user.password = generate_password_hash(user.password, method)
+            count += 1
+    db.session.commit()
+    click.echo(f'已转换明文密码 {count} 个')
@@ -0,0 +1,118 @@
+# 读写分离：被 @read_only 标记的报表类接口把查询发往只读副本（配置 READ_REPLICA_BINDS）
+# 写操作始终走主库；用户自己写入后的一段时间内（READ_YOUR_WRITES_SECONDS）读请求仍走主库，保证读到自己的写入；
+# 副本连接失败时标记为不可用（REPLICA_RETRY_INTERVAL 秒内不再使用），本次请求改用主库重试；
+# 查询本身的错误（如超过 MAX_EXECUTION_TIME 的 3024）直接抛出，不换主库重跑
+# 流式导出只覆盖开始阶段：export_response 在视图内取出第一条记录，之后的批次在发送响应时读取，中途出错不再重试
+# 必须读到最新数据的查询（如权限判断用的用户角色）加上 .execution_options(use_primary=True)，始终走主库
+from flask import g, session, current_app, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.sql.dml import UpdateBase
+from functools import wraps
+import random
+import threading
+import time
+
+# 用户最近一次写入的时间 {user_id: 时间戳}
+_last_write = {}
+# 暂不可用的副本 {bind_key: 恢复时间}
+_down_until = {}
+_lock = threading.Lock()
+
+# 连接级错误码（MySQL 客户端）：无法连接、连接已断开、查询中连接丢失
+CONNECTION_ERRORS = {2002, 2003, 2006, 2013, 2055}
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        # flush、INSERT/UPDATE/DELETE 语句和标记了 use_primary 的查询一律走主库
+        if bind is None and not self._flushing and not isinstance(clause, UpdateBase) and not _wants_primary(clause):
+            key = _replica_for_request()
+            if key:
+                return self._db.engines[key]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+# 装饰器：标记只读接口，查询可由副本承担；副本出错时改用主库重试一次（只读接口重试是安全的）
+def read_only(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.read_only = True
+        try:
+            return view(*args, **kwargs)
+        except OperationalError as e:
+            key = g.get('replica_key')
+            if not key or not _is_connection_error(e):
+                raise
+            _mark_down(key)
+            from app.models import db
+            db.session.rollback()
+            g.replica_key = None
+            return view(*args, **kwargs)
+    return wrapper
+
+
+# 选出本次请求使用的副本（同一请求内固定），不使用副本时返回 None
+def _replica_for_request():
+    if not has_request_context() or not g.get('read_only'):
+        return None
+    if 'replica_key' not in g:
+        g.replica_key = None
+        if not _recently_wrote():
+            now = time.monotonic()
+            with _lock:
+                candidates = [
+                    key for key in current_app.config.get('READ_REPLICA_BINDS', [])
+                    if _down_until.get(key, 0) <= now
+                ]
+            if candidates:
+                g.replica_key = random.choice(candidates)
+    return g.replica_key
+
+def _recently_wrote():
+    from app.tokens import get_current_user_id
+    window = current_app.config.get('READ_YOUR_WRITES_SECONDS', 0)
+    user_id = get_current_user_id()
+    if not window or not user_id:
+        return False
+    last_write = max(_last_write.get(user_id, 0), session.get('last_write_at', 0))
+    return time.time() - last_write < window
+
+def _wants_primary(clause):
+    return clause is not None and clause.get_execution_options().get('use_primary', False)
+
+def _is_connection_error(error):
+    if error.connection_invalidated:
+        return True
+    args = getattr(error.orig, 'args', ())
+    return bool(args) and args[0] in CONNECTION_ERRORS
+
+def _mark_down(key):
+    with _lock:
+        _down_until[key] = time.monotonic() + current_app.config.get('REPLICA_RETRY_INTERVAL', 30)
+
+
+# 记录用户的写入时间：ORM flush 和直接执行的 INSERT/UPDATE/DELETE 语句
+@event.listens_for(RoutingSession, 'after_flush')
+def _record_flush(db_session, flush_context):
+    _record_write()
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _record_dml(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        _record_write()
+
+# 进程内记录一份，Cookie 会话中也记录一份，使请求落到其他节点时同样生效
+def _record_write():
+    if not has_request_context():
+        return
+    from app.tokens import get_current_user_id
+    user_id = get_current_user_id()
+    if not user_id:
+        return
+    now = time.time()
+    with _lock:
+        _last_write[user_id] = now
+    if not g.get('token_claims'):
+        session['last_write_at'] = now
@@ -1,61 +1,151 @@
 # 考勤记录
 # app/routes/attendance.py
-from flask import Blueprint, request, jsonify, session
-from app.models import db, AttendanceRecord, User
-from datetime import datetime, time, timedelta
+from flask import Blueprint, request, jsonify, current_app
+from app.models import db, AttendanceRecord, AttendanceSummary, User
+from app.tokens import get_current_user_id
+from app.replica import read_only
+from app.utils import export_response, EXPORT_BATCH_SIZE, is_admin, statement_timeout
+from app.summaries import (
+    WORK_START, WORK_END, SUMMARY_CACHE_TTL, attendance_status, time_seconds, is_closed_month,
+    lock_attendance_summaries, refresh_attendance_summaries, department_summaries, format_attendance_summary
+)
+from datetime import datetime, timedelta
+from sqlalchemy import insert, update, func
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.exc import IntegrityError
 import calendar
+import hmac
+
+try:
+    import numpy as np
+except ImportError:  # 未安装 numpy 时考勤状态逐行判断
+    np = None
 
 bp = Blueprint('attendance', __name__, url_prefix='/attendance')
 
-# 辅助函数：检查用户是否为管理员
-def is_admin(user_id):
-    user = User.query.get(user_id)
-    return user and user.role == 'admin'
+# 批量上传打卡：单次请求最多的打卡条数、每条 INSERT 语句写入的行数
+BULK_PUNCH_LIMIT = 10000
+BULK_WRITE_BATCH = 1000
+
+# 部门考勤报表单次最多查询的月数；月度汇总接口读取汇总表，可查询更长的区间
+MAX_REPORT_MONTHS = 12
+MAX_SUMMARY_MONTHS = 120
 
 # 1. 打卡（签到/签退）
 @bp.route('/check', methods=['POST'])
 def check_attendance():
-    user_id = session.get('user_id')
+    user_id = get_current_user_id()
     if not user_id:
         return jsonify({'status': 'error', 'message': '未登录'}), 401
     
-    today = datetime.now().date()
-    now_time = datetime.now().time()
-    
-    # 检查今天是否已有打卡记录
-    today_record = AttendanceRecord.query.filter_by(
-        user_id=user_id,
-        date=today
-    ).first()
-    
-    if not today_record:
-        # 第一次打卡：签到
-        new_record = AttendanceRecord(
-            user_id=user_id,
-            date=today,
-            check_in=now_time
-        )
-        db.session.add(new_record)
-        db.session.commit()
-        return jsonify({'status': 'success', 'message': '签到成功', 'check_in': now_time.strftime('%H:%M:%S')})
+    now = datetime.now().replace(microsecond=0)
+    today = now.date()
+    now_time = now.time()
     
-    elif today_record.check_in and not today_record.check_out:
-        # 已有签到记录：签退
-        today_record.check_out = now_time
+    # 打卡和汇总更新在同一事务中提交
+    lock_attendance_summaries([(user_id, today)])
+    action = _punch(user_id, today, now_time)
+    if action:
+        refresh_attendance_summaries([(user_id, today)])
         db.session.commit()
+    else:
+        db.session.rollback()
+    
+    if action == 'check_in':
+        return jsonify({'status': 'success', 'message': '签到成功', 'check_in': now_time})
+    
+    elif action == 'check_out':
         return jsonify({
             'status': 'success', 
             'message': '签退成功', 
-            'check_out': now_time.strftime('%H:%M:%S')
+            'check_out': now_time
         })
     
     else:
         return jsonify({'status': 'error', 'message': '今日已完成签到和签退'}), 400
 
+# 1.1 批量上传打卡（门禁、考勤机缓存的打卡记录，使用设备上的打卡时间）
+# 请求体：{"punches": [{"user_id": 1, "timestamp": "2025-06-03 08:58:12"}, ...]}
+# 同一用户同一天的打卡合并为最早签到、最晚签退，并与已有记录合并；返回每条打卡的处理结果
+@bp.route('/bulk', methods=['POST'])
+def bulk_upload_punches():
+    # 设备使用 X-Device-Key 认证，也允许管理员登录后上传
+    device_key = request.headers.get('X-Device-Key')
+    if device_key:
+        # 按字节比较：compare_digest 不接受含非 ASCII 字符的字符串
+        if not any(hmac.compare_digest(device_key.encode(), key.encode()) for key in current_app.config['ATTENDANCE_DEVICE_KEYS']):
+            return jsonify({'status': 'error', 'message': '设备密钥无效'}), 401
+    else:
+        user_id = get_current_user_id()
+        if not user_id:
+            return jsonify({'status': 'error', 'message': '未登录'}), 401
+        if not is_admin(user_id):
+            return jsonify({'status': 'error', 'message': '只有管理员可批量上传打卡'}), 403
+    
+    data = request.get_json(silent=True) or {}
+    punches = data.get('punches')
+    if not isinstance(punches, list) or not punches:
+        return jsonify({'status': 'error', 'message': '打卡记录不能为空'}), 400
+    if len(punches) > BULK_PUNCH_LIMIT:
+        return jsonify({'status': 'error', 'message': f'单次最多上传 {BULK_PUNCH_LIMIT} 条打卡记录'}), 400
+    
+    # 校验每条打卡，解析出 (用户ID, 打卡时间)
+    results = []
+    parsed = []
+    for index, punch in enumerate(punches):
+        try:
+            user_id = int(punch['user_id'])
+            punched_at = datetime.strptime(punch['timestamp'], '%Y-%m-%d %H:%M:%S')
+        except (TypeError, KeyError, ValueError):
+            results.append({'index': index, 'status': 'error', 'message': '格式错误，应包含 user_id 和 timestamp（YYYY-MM-DD HH:MM:SS）'})
+            parsed.append(None)
+            continue
+        results.append({'index': index, 'status': 'accepted'})
+        parsed.append((user_id, punched_at))
+    
+    # 一次查询校验用户是否存在
+    user_ids = {item[0] for item in parsed if item}
+    existing_users = {row.id for row in User.query.with_entities(User.id).filter(User.id.in_(user_ids))}
+    
+    # 合并为每人每天的最早、最晚打卡
+    folded = {}
+    for index, item in enumerate(parsed):
+        if not item:
+            continue
+        user_id, punched_at = item
+        if user_id not in existing_users:
+            results[index] = {'index': index, 'status': 'error', 'message': '用户不存在'}
+            continue
+        key = (user_id, punched_at.date())
+        first, last = folded.get(key, (punched_at.time(), punched_at.time()))
+        folded[key] = (min(first, punched_at.time()), max(last, punched_at.time()))
+    
+    rows = [{
+        'user_id': user_id,
+        'date': day,
+        'check_in': first,
+        'check_out': last if last > first else None
+    } for (user_id, day), (first, last) in folded.items()]
+    
+    if rows:
+        lock_attendance_summaries(folded)
+        _upsert_attendance(rows)
+        refresh_attendance_summaries(folded)
+        db.session.commit()
+    
+    accepted = sum(1 for result in results if result['status'] == 'accepted')
+    return jsonify({
+        'status': 'success',
+        'message': f'已接收 {accepted} 条打卡，写入 {len(rows)} 条考勤记录',
+        'accepted': accepted,
+        'rejected': len(results) - accepted,
+        'results': results
+    })
+
 # 2. 获取个人考勤记录（支持按月份筛选）
 @bp.route('/personal', methods=['GET'])
 def get_personal_attendance():
-    user_id = session.get('user_id')
+    user_id = get_current_user_id()
     if not user_id:
         return jsonify({'status': 'error', 'message': '未登录'}), 401
     
@@ -74,9 +164,9 @@ def get_personal_attendance():
     record_list = []
     for record in records:
         record_list.append({
-            'date': record.date.strftime('%Y-%m-%d'),
-            'check_in': record.check_in.strftime('%H:%M:%S') if record.check_in else None,
-            'check_out': record.check_out.strftime('%H:%M:%S') if record.check_out else None,
+            'date': record.date,
+            'check_in': record.check_in,
+            'check_out': record.check_out,
             'note': record.note,
             'status': _get_attendance_status(record)  # 迟到、早退等状态
         })
@@ -84,9 +174,12 @@ def get_personal_attendance():
     return jsonify({'status': 'success', 'records': record_list})
 
 # 3. 管理员获取部门考勤记录
+# 默认查询 year/month 指定的月份；也可用 start_month、end_month（YYYY-MM）查询连续多个月
 @bp.route('/department', methods=['GET'])
+@statement_timeout('report')
+@read_only
 def get_department_attendance():
-    user_id = session.get('user_id')
+    user_id = get_current_user_id()
     if not user_id:
         return jsonify({'status': 'error', 'message': '未登录'}), 401
     
@@ -94,43 +187,177 @@ def get_department_attendance():
         return jsonify({'status': 'error', 'message': '只有管理员可查看部门考勤'}), 403
     
     department = request.args.get('department')
-    year = request.args.get('year', datetime.now().year, type=int)
-    month = request.args.get('month', datetime.now().month, type=int)
     
     if not department:
         return jsonify({'status': 'error', 'message': '请指定部门'}), 400
     
-    # 获取部门所有用户
-    users = User.query.filter_by(department=department).all()
-    user_ids = [user.id for user in users]
+    try:
+        first_day, last_day = _report_period(request.args)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
     
-    # 获取考勤记录
-    first_day = datetime(year, month, 1).date()
-    last_day = datetime(year, month, calendar.monthrange(year, month)[1]).date()
+    # 获取部门所有用户
+    users = User.query.with_entities(User.id, User.username).filter_by(department=department).all()
     
-    records = AttendanceRecord.query.filter(
-        AttendanceRecord.user_id.in_(user_ids),
+    # 只查询需要的列，不构造 ORM 对象
+    records = db.session.query(
+        AttendanceRecord.user_id,
+        AttendanceRecord.date,
+        AttendanceRecord.check_in,
+        AttendanceRecord.check_out,
+        AttendanceRecord.note
+    ).filter(
+        AttendanceRecord.user_id.in_([user.id for user in users]),
         AttendanceRecord.date.between(first_day, last_day)
     ).order_by(AttendanceRecord.user_id, AttendanceRecord.date).all()
     
-    # 按用户分组
-    result = {}
-    for user in users:
-        user_records = [record for record in records if record.user_id == user.id]
-        result[user.username] = [{
-            'date': record.date.strftime('%Y-%m-%d'),
-            'check_in': record.check_in.strftime('%H:%M:%S') if record.check_in else None,
-            'check_out': record.check_out.strftime('%H:%M:%S') if record.check_out else None,
+    statuses = _classify_attendance(
+        [record.check_in for record in records],
+        [record.check_out for record in records]
+    )
+    
+    # 一次遍历按用户分组
+    result = {user.username: [] for user in users}
+    usernames = {user.id: user.username for user in users}
+    for record, status in zip(records, statuses):
+        result[usernames[record.user_id]].append({
+            'date': record.date,
+            'check_in': record.check_in,
+            'check_out': record.check_out,
             'note': record.note,
-            'status': _get_attendance_status(record)
-        } for record in user_records]
+            'status': status
+        })
     
     return jsonify({'status': 'success', 'attendance': result})
 
+# 3.1 管理员导出部门考勤记录（流式输出 NDJSON/CSV）
+# 不指定 month 时导出全年
+@bp.route('/department/export', methods=['GET'])
+@read_only
+def export_department_attendance():
+    user_id = get_current_user_id()
+    if not user_id:
+        return jsonify({'status': 'error', 'message': '未登录'}), 401
+    
+    if not is_admin(user_id):
+        return jsonify({'status': 'error', 'message': '只有管理员可查看部门考勤'}), 403
+    
+    department = request.args.get('department')
+    year = request.args.get('year', datetime.now().year, type=int)
+    month = request.args.get('month', type=int)
+    fmt = request.args.get('format', 'ndjson')
+    
+    if not department:
+        return jsonify({'status': 'error', 'message': '请指定部门'}), 400
+    
+    if fmt not in ('ndjson', 'csv'):
+        return jsonify({'status': 'error', 'message': '导出格式只支持 ndjson 或 csv'}), 400
+    
+    try:
+        if month:
+            first_day = datetime(year, month, 1).date()
+            last_day = datetime(year, month, calendar.monthrange(year, month)[1]).date()
+        else:
+            first_day = datetime(year, 1, 1).date()
+            last_day = datetime(year, 12, 31).date()
+    except ValueError:
+        return jsonify({'status': 'error', 'message': '年月参数格式错误'}), 400
+    
+    # yield_per 使用服务端游标分批读取，内存占用与导出范围无关
+    query = db.session.query(
+        AttendanceRecord,
+        User.username
+    ).join(
+        User, AttendanceRecord.user_id == User.id
+    ).filter(
+        User.department == department,
+        AttendanceRecord.date.between(first_day, last_day)
+    ).order_by(
+        AttendanceRecord.user_id, AttendanceRecord.date
+    ).yield_per(EXPORT_BATCH_SIZE)
+    
+    records = ({
+        'user_id': record.user_id,
+        'username': username,
+        'date': record.date,
+        'check_in': record.check_in,
+        'check_out': record.check_out,
+        'note': record.note,
+        'status': _get_attendance_status(record)
+    } for record, username in query)
+    
+    return export_response(
+        records,
+        ['user_id', 'username', 'date', 'check_in', 'check_out', 'note', 'status'],
+        fmt,
+        'attendance'
+    )
+
+# 3.2 个人考勤月度汇总（读取汇总表）
+# 默认查询当月；可用 start_month、end_month（YYYY-MM）查询连续多个月
+@bp.route('/summary', methods=['GET'])
+@read_only
+def get_personal_summary():
+    user_id = get_current_user_id()
+    if not user_id:
+        return jsonify({'status': 'error', 'message': '未登录'}), 401
+    
+    try:
+        first_day, last_day = _report_period(request.args, MAX_SUMMARY_MONTHS)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    
+    summaries = AttendanceSummary.query.filter(
+        AttendanceSummary.user_id == user_id,
+        AttendanceSummary.year.between(first_day.year, last_day.year)
+    ).order_by(AttendanceSummary.year, AttendanceSummary.month).all()
+    
+    months = set(_months(first_day, last_day))
+    return jsonify({'status': 'success', 'summary': [
+        format_attendance_summary(summary) for summary in summaries
+        if (summary.year, summary.month) in months
+    ]})
+
+# 3.3 管理员获取部门考勤月度汇总（读取汇总表，已结束的月份走缓存）
+@bp.route('/department/summary', methods=['GET'])
+@statement_timeout('report')
+@read_only
+def get_department_summary():
+    user_id = get_current_user_id()
+    if not user_id:
+        return jsonify({'status': 'error', 'message': '未登录'}), 401
+    
+    if not is_admin(user_id):
+        return jsonify({'status': 'error', 'message': '只有管理员可查看部门考勤'}), 403
+    
+    department = request.args.get('department')
+    if not department:
+        return jsonify({'status': 'error', 'message': '请指定部门'}), 400
+    
+    try:
+        first_day, last_day = _report_period(request.args, MAX_SUMMARY_MONTHS)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    
+    months = _months(first_day, last_day)
+    summaries = department_summaries(department, months)
+    
+    result = {}
+    for key in months:
+        for item in summaries[key]:
+            item = dict(item)
+            result.setdefault(item.pop('username'), []).append(item)
+    
+    response = jsonify({'status': 'success', 'summary': result})
+    # 区间内的月份都已结束时，允许客户端缓存
+    if is_closed_month(last_day.year, last_day.month):
+        response.headers['Cache-Control'] = f'private, max-age={SUMMARY_CACHE_TTL}'
+    return response
+
 # 4. 管理员添加考勤备注
 @bp.route('/add_note/<int:record_id>', methods=['POST'])
 def add_attendance_note(record_id):
-    user_id = session.get('user_id')
+    user_id = get_current_user_id()
     if not user_id:
         return jsonify({'status': 'error', 'message': '未登录'}), 401
     
@@ -147,29 +374,121 @@ def add_attendance_note(record_id):
     if not record:
         return jsonify({'status': 'error', 'message': '考勤记录不存在'}), 404
     
+    lock_attendance_summaries([(record.user_id, record.date)])
     record.note = note
+    refresh_attendance_summaries([(record.user_id, record.date)])
     db.session.commit()
     
     return jsonify({'status': 'success', 'message': '备注添加成功'})
 
-# 辅助函数：判断考勤状态
-def _get_attendance_status(record):
-    # 假设上班时间 9:00，下班时间 18:00
-    work_start = time(9, 0)  # 9:00
-    work_end = time(18, 0)   # 18:00
+# 辅助函数：原子地完成一次打卡，返回 'check_in'、'check_out' 或 None（今日已签到并签退）
+# 依赖 (user_id, date) 唯一索引：先直接插入签到记录，已存在则用条件更新写入签退时间，
+# 并发打卡时不会产生重复记录，也不需要先查询再写入；插入放在保存点中，失败时不影响事务中已持有的汇总行锁，由调用方提交
+def _punch(user_id, day, punch_time):
+    try:
+        with db.session.begin_nested():
+            db.session.execute(insert(AttendanceRecord).values(
+                user_id=user_id,
+                date=day,
+                check_in=punch_time
+            ))
+        return 'check_in'
+    except IntegrityError:
+        pass
     
-    status = '正常'
-    
-    if record.check_in and record.check_in > work_start:
-        status = '迟到'
+    result = db.session.execute(update(AttendanceRecord).where(
+        AttendanceRecord.user_id == user_id,
+        AttendanceRecord.date == day,
+        AttendanceRecord.check_in.isnot(None),
+        AttendanceRecord.check_out.is_(None)
+    ).values(check_out=punch_time))
+    return 'check_out' if result.rowcount else None
+
+# 辅助函数：批量写入每人每天的打卡区间，与已有记录合并（签到取更早、签退取更晚）
+# MySQL 使用多行 INSERT ... ON DUPLICATE KEY UPDATE；其他数据库（开发环境）先批量查询已有记录再合并写入
+def _upsert_attendance(rows):
+    if db.session.get_bind().dialect.name == 'mysql':
+        for start in range(0, len(rows), BULK_WRITE_BATCH):
+            stmt = mysql_insert(AttendanceRecord).values(rows[start:start + BULK_WRITE_BATCH])
+            new_in = stmt.inserted.check_in
+            new_out = func.coalesce(stmt.inserted.check_out, stmt.inserted.check_in)
+            old_in = func.coalesce(AttendanceRecord.check_in, new_in)
+            # ON DUPLICATE KEY UPDATE 按顺序赋值，check_out 需在 check_in 更新前用原值计算
+            stmt = stmt.on_duplicate_key_update([
+                ('check_out', func.nullif(
+                    func.greatest(func.coalesce(AttendanceRecord.check_out, old_in), new_out),
+                    func.least(old_in, new_in)
+                )),
+                ('check_in', func.least(old_in, new_in)),
+            ])
+            db.session.execute(stmt)
+        return
     
-    if record.check_out and record.check_out < work_end:
-        if status == '迟到':
-            status = '迟到+早退'
+    for start in range(0, len(rows), BULK_WRITE_BATCH):
+        batch = {(row['user_id'], row['date']): row for row in rows[start:start + BULK_WRITE_BATCH]}
+        days = [day for _, day in batch]
+        existing = AttendanceRecord.query.filter(
+            AttendanceRecord.user_id.in_({user_id for user_id, _ in batch}),
+            AttendanceRecord.date.between(min(days), max(days))
+        ).all()
+        for record in existing:
+            row = batch.pop((record.user_id, record.date), None)
+            if not row:
+                continue
+            times = [t for t in (record.check_in, record.check_out, row['check_in'], row['check_out']) if t]
+            record.check_in = min(times)
+            record.check_out = max(times) if max(times) > min(times) else None
+        if batch:
+            db.session.execute(insert(AttendanceRecord.__table__), list(batch.values()))
+
+# 辅助函数：解析考勤报表的查询区间，返回 (第一天, 最后一天)；参数错误时抛出 ValueError
+def _report_period(args, max_months=MAX_REPORT_MONTHS):
+    now = datetime.now()
+    start = args.get('start_month')
+    end = args.get('end_month')
+    try:
+        if start or end:
+            start = datetime.strptime(start or end, '%Y-%m')
+            end = datetime.strptime(end or start.strftime('%Y-%m'), '%Y-%m')
         else:
-            status = '早退'
+            start = end = datetime(args.get('year', now.year, type=int), args.get('month', now.month, type=int), 1)
+    except ValueError:
+        raise ValueError('年月参数格式错误')
+    
+    months = (end.year - start.year) * 12 + end.month - start.month + 1
+    if months < 1:
+        raise ValueError('结束月份不能早于开始月份')
+    if months > max_months:
+        raise ValueError(f'单次最多查询 {max_months} 个月')
+    
+    return start.date(), end.replace(day=calendar.monthrange(end.year, end.month)[1]).date()
+
+# 辅助函数：区间内的 (年, 月) 列表
+def _months(first_day, last_day):
+    return [
+        (year, month)
+        for year in range(first_day.year, last_day.year + 1)
+        for month in range(1, 13)
+        if (first_day.year, first_day.month) <= (year, month) <= (last_day.year, last_day.month)
+    ]
+
+# 辅助函数：批量判断考勤状态，返回与输入顺序一致的状态列表
+# 安装了 numpy 时按列向量化计算，否则逐行判断
+def _classify_attendance(check_ins, check_outs):
+    if np is None or not check_ins:
+        return [attendance_status(check_in, check_out) for check_in, check_out in zip(check_ins, check_outs)]
+    
+    # 转换为当天的秒数，未打卡记为 -1
+    ins = np.fromiter((time_seconds(t) for t in check_ins), dtype=np.int32, count=len(check_ins))
+    outs = np.fromiter((time_seconds(t) for t in check_outs), dtype=np.int32, count=len(check_outs))
     
-    if not record.check_in or not record.check_out:
-        status = '缺勤'
+    late = ins > time_seconds(WORK_START)
+    early = (outs >= 0) & (outs < time_seconds(WORK_END))
+    absent = (ins < 0) | (outs < 0)
     
-    return status
\ No newline at end of file
+    status = np.select([absent, late & early, late, early], ['缺勤', '迟到+早退', '迟到', '早退'], default='正常')
+    return status.tolist()
+
+# 辅助函数：判断考勤状态
+def _get_attendance_status(record):
+    return attendance_status(record.check_in, record.check_out)
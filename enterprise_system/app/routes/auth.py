@@ -1,6 +1,9 @@
-from flask import Blueprint, request, jsonify, session
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import Blueprint, request, jsonify, session, g
 from app.models import db, User
+from app.passwords import hash_password, verify_password
+from sqlalchemy.exc import IntegrityError
+from app.tokens import issue_tokens, decode_token, revoke_token, is_revoked, get_current_user_id
+import jwt
 
 bp = Blueprint('auth', __name__, url_prefix='/auth')
 
@@ -13,11 +16,13 @@ def register():
     email = data.get('email')
     department = data.get('department')
 
+    if not username or not password:
+        return jsonify({'status': 'error', 'message': '用户名和密码不能为空'}), 400
+
     if User.query.filter_by(username=username).first():
         return jsonify({'status': 'error', 'message': '用户名已存在'}), 400
 
-    # hashed_password = generate_password_hash(password)  password=hashed_password
-    new_user = User(username=username, password=password, email=email, department=department)
+    new_user = User(username=username, password=hash_password(password), email=email, department=department)
     db.session.add(new_user)
     db.session.commit()
 
@@ -30,9 +35,8 @@ def login():
     username = data.get('username')
     password = data.get('password')
 
-    user = User.query.filter_by(username=username).first()
-    # if user and check_password_hash(user.password, password):
-    if user and user.password == password:  # 直接比较明文密码
+    user = _authenticate(username, password)
+    if user:
         session['user_id'] = user.id
         session['username'] = user.username
         session['role'] = user.role
@@ -42,19 +46,76 @@ def login():
     else:
         return jsonify({'status': 'error', 'message': '用户名或密码错误'}), 401
 
+# 获取 JWT 令牌（无状态认证，之后在请求头携带 Authorization: Bearer <access_token>）
+@bp.route('/token', methods=['POST'])
+def get_token():
+    data = request.json
+    username = data.get('username')
+    password = data.get('password')
+
+    user = _authenticate(username, password)
+    if not user:
+        return jsonify({'status': 'error', 'message': '用户名或密码错误'}), 401
+
+    return jsonify({'status': 'success', 'message': '登录成功', **issue_tokens(user)})
+
+# 使用刷新令牌换取新令牌（旧刷新令牌随即吊销）
+@bp.route('/refresh', methods=['POST'])
+def refresh_token():
+    data = request.json or {}
+    try:
+        claims = decode_token(data.get('refresh_token') or '', 'refresh')
+    except jwt.InvalidTokenError:
+        return jsonify({'status': 'error', 'message': '刷新令牌无效或已过期'}), 401
+
+    if is_revoked(claims):
+        return jsonify({'status': 'error', 'message': '刷新令牌已失效'}), 401
+
+    # 刷新时重新读取用户，令牌中的角色、部门随之更新
+    user = User.query.get(int(claims['sub']))
+    if not user:
+        return jsonify({'status': 'error', 'message': '用户不存在'}), 401
+
+    revoke_token(claims)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # 并发请求已使用同一个刷新令牌
+        db.session.rollback()
+        return jsonify({'status': 'error', 'message': '刷新令牌已失效'}), 401
+
+    return jsonify({'status': 'success', **issue_tokens(user)})
+
 # 退出登录
 @bp.route('/logout', methods=['POST'])
 def logout():
+    # 令牌模式下吊销当前访问令牌以及请求体中的刷新令牌
+    claims = g.get('token_claims')
+    if claims:
+        revoke_token(claims)
+    refresh = (request.get_json(silent=True) or {}).get('refresh_token')
+    if refresh:
+        try:
+            revoke_token(decode_token(refresh, 'refresh'))
+        except jwt.InvalidTokenError:
+            pass
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # 令牌已被并发请求吊销
+        db.session.rollback()
+
     session.clear()
     return jsonify({'status': 'success', 'message': '已退出登录'})
 
 # 获取当前登录用户信息
 @bp.route('/me', methods=['GET'])
 def current_user():
-    if 'user_id' not in session:
+    user_id = get_current_user_id()
+    if not user_id:
         return jsonify({'status': 'error', 'message': '未登录'}), 401
 
-    user = User.query.get(session['user_id'])
+    user = User.query.get(user_id)
     return jsonify({
         'status': 'success',
         'user': {
@@ -66,3 +127,16 @@ def current_user():
             'description': user.description
         }
     })
+
+# 辅助函数：校验用户名和密码，成功时返回用户；历史明文密码或按旧参数生成的哈希在登录成功时更新
+def _authenticate(username, password):
+    if not username or not password:
+        return None
+    user = User.query.filter_by(username=username).first()
+    valid, new_hash = verify_password(user.password if user else None, password)
+    if not valid:
+        return None
+    if new_hash:
+        user.password = new_hash
+        db.session.commit()
+    return user
@@ -1,21 +1,19 @@
 # 请假申请与审批
 # app/routes/leave.py
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, request, jsonify
 from app.models import db, LeaveRequest, User
+from app.tokens import get_current_user_id
+from app.replica import read_only
+from app.utils import get_usernames, keyset_paginate, is_manager_or_admin, statement_timeout
 from datetime import datetime, date
 from sqlalchemy import or_
 
 bp = Blueprint('leave', __name__, url_prefix='/leave')
 
-# 辅助函数：检查用户是否为管理员或部门经理
-def is_manager_or_admin(user_id):
-    user = User.query.get(user_id)
-    return user and (user.role == 'admin' or user.role == 'manager')
-
 # 1. 提交请假申请
 @bp.route('/submit', methods=['POST'])
 def submit_leave_request():
-    user_id = session.get('user_id')
+    user_id = get_current_user_id()
     if not user_id:
         return jsonify({'status': 'error', 'message': '未登录'}), 401
     
@@ -61,7 +59,7 @@ def submit_leave_request():
 # 2. 获取当前用户的请假记录
 @bp.route('/my_requests', methods=['GET'])
 def get_my_leave_requests():
-    user_id = session.get('user_id')
+    user_id = get_current_user_id()
     if not user_id:
         return jsonify({'status': 'error', 'message': '未登录'}), 401
     
@@ -72,13 +70,13 @@ def get_my_leave_requests():
     
     return jsonify({
         'status': 'success',
-        'requests': [_format_leave_request(req) for req in leave_requests]
+        'requests': _format_leave_requests(leave_requests)
     })
 
 # 3. 管理员/经理获取待审批的请假申请
 @bp.route('/pending', methods=['GET'])
 def get_pending_leave_requests():
-    user_id = session.get('user_id')
+    user_id = get_current_user_id()
     if not user_id:
         return jsonify({'status': 'error', 'message': '未登录'}), 401
     
@@ -95,13 +93,13 @@ def get_pending_leave_requests():
     
     return jsonify({
         'status': 'success',
-        'requests': [_format_leave_request(req) for req in pending_requests]
+        'requests': _format_leave_requests(pending_requests)
     })
 
 # 4. 审批请假申请
 @bp.route('/approve/<int:leave_id>', methods=['POST'])
 def approve_leave_request(leave_id):
-    user_id = session.get('user_id')
+    user_id = get_current_user_id()
     if not user_id:
         return jsonify({'status': 'error', 'message': '未登录'}), 401
     
@@ -141,8 +139,10 @@ def approve_leave_request(leave_id):
 
 # 5. 获取所有请假记录（管理员/经理）
 @bp.route('/all', methods=['GET'])
+@statement_timeout('report')
+@read_only
 def get_all_leave_requests():
-    user_id = session.get('user_id')
+    user_id = get_current_user_id()
     if not user_id:
         return jsonify({'status': 'error', 'message': '未登录'}), 401
     
@@ -150,20 +150,25 @@ def get_all_leave_requests():
     if not is_manager_or_admin(user_id):
         return jsonify({'status': 'error', 'message': '无权限访问'}), 403
     
-    # 获取所有请假记录，按提交时间降序排列
-    all_requests = LeaveRequest.query.order_by(
-        LeaveRequest.submitted_at.desc()
-    ).all()
+    # 获取所有请假记录，按提交时间降序游标分页
+    try:
+        all_requests, next_cursor, total = keyset_paginate(
+            LeaveRequest.query, [LeaveRequest.submitted_at, LeaveRequest.id]
+        )
+    except ValueError:
+        return jsonify({'status': 'error', 'message': '分页参数错误'}), 400
     
     return jsonify({
         'status': 'success',
-        'requests': [_format_leave_request(req) for req in all_requests]
+        'requests': _format_leave_requests(all_requests),
+        'next_cursor': next_cursor,
+        'total': total
     })
 
 # 6. 获取单个请假记录详情
 @bp.route('/detail/<int:leave_id>', methods=['GET'])
 def get_leave_request_detail(leave_id):
-    user_id = session.get('user_id')
+    user_id = get_current_user_id()
     if not user_id:
         return jsonify({'status': 'error', 'message': '未登录'}), 401
     
@@ -177,25 +182,29 @@ def get_leave_request_detail(leave_id):
     
     return jsonify({
         'status': 'success',
-        'request': _format_leave_request(leave_request)
+        'request': _format_leave_requests([leave_request])[0]
     })
 
+# 辅助函数：批量格式化请假申请数据（申请人和审批人用户名一次查询取回）
+def _format_leave_requests(requests):
+    usernames = get_usernames(
+        [req.user_id for req in requests] + [req.approved_by for req in requests]
+    )
+    return [_format_leave_request(req, usernames) for req in requests]
+
 # 辅助函数：格式化请假申请数据
-def _format_leave_request(req):
-    user = User.query.get(req.user_id)
-    approver = User.query.get(req.approved_by) if req.approved_by else None
-    
+def _format_leave_request(req, usernames):
     return {
         'id': req.id,
         'user_id': req.user_id,
-        'username': user.username if user else '未知',
+        'username': usernames.get(req.user_id, '未知'),
         'leave_type': req.leave_type,
-        'start_date': req.start_date.strftime('%Y-%m-%d'),
-        'end_date': req.end_date.strftime('%Y-%m-%d'),
+        'start_date': req.start_date,
+        'end_date': req.end_date,
         'duration': (req.end_date - req.start_date).days + 1,  # 计算请假天数
         'reason': req.reason,
         'status': req.status,
-        'submitted_at': req.submitted_at.strftime('%Y-%m-%d %H:%M:%S'),
-        'approved_by': approver.username if approver else '未审批',
-        'approved_at': req.approved_at.strftime('%Y-%m-%d %H:%M:%S') if req.approved_at else '未审批'
+        'submitted_at': req.submitted_at,
+        'approved_by': usernames.get(req.approved_by, '未审批'),
+        'approved_at': req.approved_at or '未审批'
     }
\ No newline at end of file
@@ -1,7 +1,11 @@
 # 工作日志
 # app/routes/log.py
-from flask import Blueprint, request, jsonify, session
-from app.models import db, WorkLog, User
+from flask import Blueprint, request, jsonify
+from app.models import db, WorkLog, WorkLogSummary, User
+from app.tokens import get_current_user_id
+from app.replica import read_only
+from app.utils import keyset_paginate, export_response, EXPORT_BATCH_SIZE, is_admin, is_manager_or_admin, statement_timeout
+from app.summaries import lock_work_log_summaries, refresh_work_log_summaries
 from datetime import datetime, date
 from sqlalchemy import func
 
@@ -10,7 +14,7 @@ bp = Blueprint('work_log', __name__, url_prefix='/log')
 # 1. 提交工作日志
 @bp.route('/submit', methods=['POST'])
 def submit_work_log():
-    user_id = session.get('user_id')
+    user_id = get_current_user_id()
     if not user_id:
         return jsonify({'status': 'error', 'message': '未登录'}), 401
     
@@ -45,6 +49,7 @@ def submit_work_log():
     if existing_log:
         return jsonify({'status': 'error', 'message': '当天已提交日志，请勿重复提交'}), 400
     
+    lock_work_log_summaries([(user_id, log_date)])
     new_log = WorkLog(
         user_id=user_id,
         log_date=log_date,
@@ -53,6 +58,7 @@ def submit_work_log():
     )
     
     db.session.add(new_log)
+    refresh_work_log_summaries([(user_id, log_date)])
     db.session.commit()
     
     return jsonify({
@@ -64,7 +70,7 @@ def submit_work_log():
 # 2. 修改工作日志
 @bp.route('/update/<int:log_id>', methods=['POST'])
 def update_work_log(log_id):
-    user_id = session.get('user_id')
+    user_id = get_current_user_id()
     if not user_id:
         return jsonify({'status': 'error', 'message': '未登录'}), 401
     
@@ -88,6 +94,10 @@ def update_work_log(log_id):
                 raise ValueError
         except ValueError:
             return jsonify({'status': 'error', 'message': '时长必须在1-24小时之间'}), 400
+    
+    # 参数校验通过后再锁定汇总行，非法请求不占用锁
+    lock_work_log_summaries([(log.user_id, log.log_date)])
+    if duration_hours is not None:
         log.duration_hours = duration_hours
     
     if content is not None:
@@ -95,6 +105,7 @@ def update_work_log(log_id):
     
     log.created_at = datetime.utcnow()  # 更新创建时间
     
+    refresh_work_log_summaries([(log.user_id, log.log_date)])
     db.session.commit()
     
     return jsonify({
@@ -105,7 +116,7 @@ def update_work_log(log_id):
 # 3. 获取个人工作日志列表
 @bp.route('/my_logs', methods=['GET'])
 def get_my_work_logs():
-    user_id = session.get('user_id')
+    user_id = get_current_user_id()
     if not user_id:
         return jsonify({'status': 'error', 'message': '未登录'}), 401
     
@@ -113,62 +124,38 @@ def get_my_work_logs():
     year = request.args.get('year')
     month = request.args.get('month')
     
-    query = WorkLog.query.filter_by(user_id=user_id)
+    query = _work_log_query().filter(WorkLog.user_id == user_id)
     
     # 处理筛选条件
-    if year:
-        try:
-            year = int(year)
-            start_date = date(year, 1, 1)
-            end_date = date(year + 1, 1, 1)
-            query = query.filter(
-                WorkLog.log_date >= start_date,
-                WorkLog.log_date < end_date
-            )
-        except ValueError:
-            return jsonify({'status': 'error', 'message': '年份参数格式错误'}), 400
-    
-    if month:
-        try:
-            month = int(month)
-            current_year = datetime.now().year
-            # 如果同时指定了年份，使用该年份；否则使用当前年份
-            if year:
-                target_year = int(year)
-            else:
-                target_year = current_year
-            
-            start_date = date(target_year, month, 1)
-            if month == 12:
-                end_date = date(target_year + 1, 1, 1)
-            else:
-                end_date = date(target_year, month + 1, 1)
-            
-            query = query.filter(
-                WorkLog.log_date >= start_date,
-                WorkLog.log_date < end_date
-            )
-        except ValueError:
-            return jsonify({'status': 'error', 'message': '月份参数格式错误'}), 400
+    try:
+        query = _filter_log_period(query, year, month)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
     
-    # 按日期降序排列
-    logs = query.order_by(WorkLog.log_date.desc()).all()
+    # 按日期降序游标分页
+    try:
+        logs, next_cursor, total = keyset_paginate(query, [WorkLog.log_date, WorkLog.id])
+    except ValueError:
+        return jsonify({'status': 'error', 'message': '分页参数错误'}), 400
     
     return jsonify({
         'status': 'success',
-        'logs': [_format_work_log(log) for log in logs]
+        'logs': [_format_work_log(log, username) for log, username in logs],
+        'next_cursor': next_cursor,
+        'total': total
     })
 
 # 5. 管理员获取所有工作日志
 @bp.route('/all', methods=['GET'])
+@statement_timeout('report')
+@read_only
 def get_all_work_logs():
-    user_id = session.get('user_id')
+    user_id = get_current_user_id()
     if not user_id:
         return jsonify({'status': 'error', 'message': '未登录'}), 401
     
     # 只有管理员可以查看所有日志
-    user = User.query.get(user_id)
-    if not user or user.role != 'admin':
+    if not is_admin(user_id):
         return jsonify({'status': 'error', 'message': '无权限访问'}), 403
     
     # 获取参数（可选）：用户ID、年、月筛选
@@ -176,124 +163,72 @@ def get_all_work_logs():
     year = request.args.get('year')
     month = request.args.get('month')
     
-    query = WorkLog.query
+    query = _work_log_query()
     
     if user_filter:
         query = query.filter(WorkLog.user_id == user_filter)
     
     # 处理筛选条件（与个人日志逻辑相同）
-    if year:
-        try:
-            year = int(year)
-            start_date = date(year, 1, 1)
-            end_date = date(year + 1, 1, 1)
-            query = query.filter(
-                WorkLog.log_date >= start_date,
-                WorkLog.log_date < end_date
-            )
-        except ValueError:
-            return jsonify({'status': 'error', 'message': '年份参数格式错误'}), 400
-    
-    if month:
-        try:
-            month = int(month)
-            current_year = datetime.now().year
-            if year:
-                target_year = int(year)
-            else:
-                target_year = current_year
-            
-            start_date = date(target_year, month, 1)
-            if month == 12:
-                end_date = date(target_year + 1, 1, 1)
-            else:
-                end_date = date(target_year, month + 1, 1)
-            
-            query = query.filter(
-                WorkLog.log_date >= start_date,
-                WorkLog.log_date < end_date
-            )
-        except ValueError:
-            return jsonify({'status': 'error', 'message': '月份参数格式错误'}), 400
+    try:
+        query = _filter_log_period(query, year, month)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
     
-    logs = query.order_by(WorkLog.log_date.desc()).all()
+    try:
+        logs, next_cursor, total = keyset_paginate(query, [WorkLog.log_date, WorkLog.id])
+    except ValueError:
+        return jsonify({'status': 'error', 'message': '分页参数错误'}), 400
     
     return jsonify({
         'status': 'success',
-        'logs': [_format_work_log(log) for log in logs]
+        'logs': [_format_work_log(log, username) for log, username in logs],
+        'next_cursor': next_cursor,
+        'total': total
     })
 
-# 6. 获取团队成员日志统计（管理员/经理）
+# 6. 获取团队成员日志统计（管理员/经理），读取工作日志月度汇总表，统计周期由月份汇总组合而成
 @bp.route('/team_stats', methods=['GET'])
+@statement_timeout('report')
+@read_only
 def get_team_log_stats():
-    user_id = session.get('user_id')
+    user_id = get_current_user_id()
     if not user_id:
         return jsonify({'status': 'error', 'message': '未登录'}), 401
     
     # 只有管理员或经理可以查看团队统计
-    user = User.query.get(user_id)
-    if not user or (user.role != 'admin' and user.role != 'manager'):
+    if not is_manager_or_admin(user_id):
         return jsonify({'status': 'error', 'message': '无权限访问'}), 403
     
     # 获取可选参数：年、月筛选
     year = request.args.get('year')
     month = request.args.get('month')
     
-    # 构建查询条件
-    conditions = []
-    
-    if year:
-        try:
-            year = int(year)
-            start_date = date(year, 1, 1)
-            if month:
-                month = int(month)
-                start_date = date(year, month, 1)
-                if month == 12:
-                    end_date = date(year + 1, 1, 1)
-                else:
-                    end_date = date(year, month + 1, 1)
-            else:
-                end_date = date(year + 1, 1, 1)
-            
-            conditions.extend([
-                WorkLog.log_date >= start_date,
-                WorkLog.log_date < end_date
-            ])
-        except ValueError:
-            return jsonify({'status': 'error', 'message': '年月参数格式错误'}), 400
-    
-    elif month:  # 只指定月份时，默认使用当前年份
-        try:
-            month = int(month)
-            current_year = datetime.now().year
-            start_date = date(current_year, month, 1)
-            if month == 12:
-                end_date = date(current_year + 1, 1, 1)
-            else:
-                end_date = date(current_year, month + 1, 1)
-            
-            conditions.extend([
-                WorkLog.log_date >= start_date,
-                WorkLog.log_date < end_date
-            ])
-        except ValueError:
-            return jsonify({'status': 'error', 'message': '月份参数格式错误'}), 400
-    
     # 查询每个用户的日志总时长
     query = db.session.query(
-        WorkLog.user_id,
+        WorkLogSummary.user_id,
         User.username,
-        func.sum(WorkLog.duration_hours).label('total_hours'),
-        func.count(WorkLog.id).label('log_count')
+        func.sum(WorkLogSummary.total_hours).label('total_hours'),
+        func.sum(WorkLogSummary.log_count).label('log_count')
     ).join(
-        User, WorkLog.user_id == User.id
+        User, WorkLogSummary.user_id == User.id
     )
     
-    if conditions:
-        query = query.filter(*conditions)
-    
-    query = query.group_by(WorkLog.user_id, User.username)
+    try:
+        period = _parse_log_period(year, month)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    
+    # 统计周期为整年或整月，换算为月份区间 [起始月, 结束月)
+    if period:
+        start_month = period[0].year * 100 + period[0].month
+        end_month = period[1].year * 100 + period[1].month
+        query = query.filter(
+            WorkLogSummary.year.between(period[0].year, period[1].year),
+            WorkLogSummary.year * 100 + WorkLogSummary.month >= start_month,
+            WorkLogSummary.year * 100 + WorkLogSummary.month < end_month
+        )
+    
+    query = query.group_by(WorkLogSummary.user_id, User.username)
     
     stats = query.all()
     
@@ -303,8 +238,8 @@ def get_team_log_stats():
             'user_id': stat.user_id,
             'username': stat.username,
             'total_hours': float(stat.total_hours),
-            'log_count': stat.log_count,
-            'avg_hours_per_day': float(stat.total_hours) / stat.log_count if stat.log_count > 0 else 0
+            'log_count': int(stat.log_count),
+            'avg_hours_per_day': float(stat.total_hours) / int(stat.log_count) if stat.log_count > 0 else 0
         })
     
     # 生成统计周期描述
@@ -322,16 +257,105 @@ def get_team_log_stats():
         'period': period_desc
     })
 
-# 辅助函数：格式化工作日志数据
-def _format_work_log(log):
-    user = User.query.get(log.user_id)
+# 7. 管理员导出工作日志（流式输出 NDJSON/CSV，筛选参数同 /log/all）
+@bp.route('/export', methods=['GET'])
+@read_only
+def export_work_logs():
+    user_id = get_current_user_id()
+    if not user_id:
+        return jsonify({'status': 'error', 'message': '未登录'}), 401
+    
+    if not is_admin(user_id):
+        return jsonify({'status': 'error', 'message': '无权限访问'}), 403
+    
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in ('ndjson', 'csv'):
+        return jsonify({'status': 'error', 'message': '导出格式只支持 ndjson 或 csv'}), 400
+    
+    user_filter = request.args.get('user_id')
+    year = request.args.get('year')
+    month = request.args.get('month')
+    
+    query = _work_log_query()
+    
+    if user_filter:
+        query = query.filter(WorkLog.user_id == user_filter)
+    
+    try:
+        query = _filter_log_period(query, year, month)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    
+    # yield_per 使用服务端游标分批读取，内存占用与导出范围无关
+    query = query.order_by(WorkLog.log_date.desc(), WorkLog.id.desc()).yield_per(EXPORT_BATCH_SIZE)
+    records = (_format_work_log(log, username) for log, username in query)
+    
+    return export_response(
+        records,
+        ['id', 'user_id', 'username', 'log_date', 'duration_hours', 'content', 'created_at'],
+        fmt,
+        'work_logs'
+    )
+
+# 辅助函数：解析年/月筛选参数，返回日期区间 [start_date, end_date)，未指定时返回 None
+# 只指定月份时默认使用当前年份；参数错误时抛出带提示信息的 ValueError
+def _parse_log_period(year, month):
+    if not year and not month:
+        return None
     
+    try:
+        target_year = int(year) if year else datetime.now().year
+    except ValueError:
+        raise ValueError('年份参数格式错误')
+    
+    if month:
+        try:
+            month = int(month)
+        except ValueError:
+            raise ValueError('月份参数格式错误')
+        if not 1 <= month <= 12:
+            raise ValueError('月份必须在 1 到 12 之间')
+    
+    try:
+        if not month:
+            return date(target_year, 1, 1), date(target_year + 1, 1, 1)
+        start_date = date(target_year, month, 1)
+        if month == 12:
+            end_date = date(target_year + 1, 1, 1)
+        else:
+            end_date = date(target_year, month + 1, 1)
+        return start_date, end_date
+    except ValueError:
+        # 月份已校验，这里只可能是年份超出范围
+        raise ValueError('年份参数格式错误')
+
+# 辅助函数：按年/月筛选日志，统一走 log_date 区间查询
+def _filter_log_period(query, year, month):
+    period = _parse_log_period(year, month)
+    if period:
+        query = query.filter(
+            WorkLog.log_date >= period[0],
+            WorkLog.log_date < period[1]
+        )
+    return query
+
+# 辅助函数：查询工作日志并关联用户名（避免逐条查询用户）
+def _work_log_query():
+    return db.session.query(
+        WorkLog,
+        User.username
+    ).outerjoin(
+        User, WorkLog.user_id == User.id
+    )
+
+# 辅助函数：格式化工作日志数据
+def _format_work_log(log, username=None):
     return {
         'id': log.id,
         'user_id': log.user_id,
-        'username': user.username if user else '未知',
-        'log_date': log.log_date.strftime('%Y-%m-%d'),
-        'duration_hours': float(log.duration_hours),
+        'username': username or '未知',
+        'log_date': log.log_date,
+        'duration_hours': log.duration_hours,
         'content': log.content,
-        'created_at': log.created_at.strftime('%Y-%m-%d %H:%M:%S')
+        'created_at': log.created_at
     }
\ No newline at end of file
@@ -1,18 +1,28 @@
 # 内部邮件管理
-from flask import Blueprint, request, jsonify, session
-from app.models import db, Mail, User, datetime
+from flask import Blueprint, request, jsonify
+from app.models import db, Mail, MailBroadcast, MailCounter, MailThreadIndex, User, datetime
+from app.tokens import get_current_user_id
+from app.utils import keyset_paginate, get_user_info, is_admin
+from sqlalchemy import and_, case, func, insert, literal, or_, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
 
 bp = Blueprint('mail', __name__, url_prefix='/mail')
 
+# 摘要模式下正文预览的字符数
+PREVIEW_LENGTH = 50
+# 批量标记已读单次最多的邮件数
+MAX_BULK_READ = 1000
+
 # 发送邮件
 @bp.route('/send', methods=['POST'])
 def send_mail():
     data = request.json
-    sender_id = session.get('user_id')
+    sender_id = get_current_user_id()
     receiver_id = data.get('receiver_id')
     subject = data.get('subject')
     content = data.get('content')
-    is_reply = data.get('is_reply', False)
 
     if not sender_id:
         return jsonify({'status': 'error', 'message': '未登录'}), 401
@@ -20,7 +30,7 @@ def send_mail():
     if not receiver_id or not subject or not content:
         return jsonify({'status': 'error', 'message': '收件人、主题和内容不能为空'}), 400
 
-    receiver = User.query.get(receiver_id)
+    receiver = get_user_info(receiver_id)
     if not receiver:
         return jsonify({'status': 'error', 'message': '收件人不存在'}), 404
 
@@ -29,63 +39,141 @@ def send_mail():
         receiver_id=receiver_id,
         subject=subject,
         content=content,
-        is_reply=is_reply
+        is_reply=False  # 是否已被回复，只由回复接口设置
     )
     db.session.add(new_mail)
+    # 新邮件自成一个会话
+    db.session.flush()
+    new_mail.thread_id = new_mail.id
+    _index_thread(new_mail)
+    _bump_counters(receiver.id, unread=1)
     db.session.commit()
 
     return jsonify({'status': 'success', 'message': '邮件发送成功'})
 
+# 管理员按部门/角色群发邮件：请求体 {"department": "...", "role": "...", "subject": "...", "content": "..."}
+# 部门和角色至少指定一个（同时指定时取交集），发件人本人不在收件人中
+# 正文只在 mail_broadcasts 中保存一份；收件人邮件行用一条 INSERT ... SELECT 写入，与未读计数在同一事务中更新
+@bp.route('/broadcast', methods=['POST'])
+def broadcast_mail():
+    sender_id = get_current_user_id()
+    if not sender_id:
+        return jsonify({'status': 'error', 'message': '未登录'}), 401
+
+    if not is_admin(sender_id):
+        return jsonify({'status': 'error', 'message': '只有管理员可群发邮件'}), 403
+
+    data = request.get_json(silent=True) or {}
+    department = data.get('department')
+    role = data.get('role')
+    subject = data.get('subject')
+    content = data.get('content')
+
+    if not department and not role:
+        return jsonify({'status': 'error', 'message': '请指定收件部门或角色'}), 400
+
+    if role and role not in ('employee', 'manager', 'admin'):
+        return jsonify({'status': 'error', 'message': '角色只能是 employee、manager 或 admin'}), 400
+
+    if not subject or not content:
+        return jsonify({'status': 'error', 'message': '主题和内容不能为空'}), 400
+
+    conditions = [User.id != sender_id]
+    if department:
+        conditions.append(User.department == department)
+    if role:
+        conditions.append(User.role == role)
+
+    now = datetime.utcnow()
+    broadcast = MailBroadcast(
+        sender_id=sender_id,
+        subject=subject,
+        content=content,
+        department=department,
+        role=role,
+        sent_at=now
+    )
+    db.session.add(broadcast)
+    db.session.flush()
+
+    result = db.session.execute(insert(Mail).from_select(
+        ['sender_id', 'receiver_id', 'subject', 'is_read', 'is_reply', 'sent_at', 'broadcast_id'],
+        db.select(
+            literal(sender_id), User.id, literal(subject), literal(False), literal(False), literal(now), literal(broadcast.id)
+        ).where(*conditions)
+    ))
+    if not result.rowcount:
+        db.session.rollback()
+        return jsonify({'status': 'error', 'message': '没有符合条件的收件人'}), 404
+
+    broadcast.recipient_count = result.rowcount
+    # 每个收件人的邮件各自成为一个会话
+    db.session.execute(update(Mail).where(Mail.broadcast_id == broadcast.id).values(thread_id=Mail.id))
+    for user_column in (Mail.receiver_id, Mail.sender_id):
+        db.session.execute(insert(MailThreadIndex).from_select(
+            ['user_id', 'thread_id', 'last_mail_id'],
+            db.select(user_column, Mail.id, Mail.id).where(Mail.broadcast_id == broadcast.id)
+        ))
+    db.session.execute(update(MailCounter).where(
+        MailCounter.user_id.in_(db.select(User.id).where(*conditions))
+    ).values(unread_count=MailCounter.unread_count + 1))
+    db.session.commit()
+
+    return jsonify({
+        'status': 'success',
+        'message': f'群发邮件已发送给 {broadcast.recipient_count} 人',
+        'broadcast_id': broadcast.id,
+        'recipient_count': broadcast.recipient_count
+    })
+
 # 获取收件箱邮件列表
 @bp.route('/inbox', methods=['GET'])
 def get_inbox():
-    user_id = session.get('user_id')
+    user_id = get_current_user_id()
     if not user_id:
         return jsonify({'status': 'error', 'message': '未登录'}), 401
 
-    mails = Mail.query.filter_by(receiver_id=user_id).order_by(Mail.sent_at.desc()).all()
+    # mode=summary 时只返回邮件头和正文预览，正文通过 /mail/detail/<id> 按需获取
+    summary = request.args.get('mode') == 'summary'
+    try:
+        rows, next_cursor, total = _mail_page(Mail.receiver_id == user_id, summary)
+    except ValueError:
+        return jsonify({'status': 'error', 'message': '分页参数错误'}), 400
+
     mail_list = []
-    for mail in mails:
-        sender = User.query.get(mail.sender_id)
-        mail_list.append({
-            'id': mail.id,
-            'sender': sender.username,
-            'subject': mail.subject,
-            'content': mail.content,
-            'is_read': mail.is_read,
-            'is_reply': mail.is_reply,
-            'sent_at': mail.sent_at.strftime('%Y-%m-%d %H:%M:%S')
-        })
+    for row in rows:
+        item = _format_mail_row(row, summary)
+        item['sender'] = row.sender_name or '未知'
+        mail_list.append(item)
 
-    return jsonify({'status': 'success', 'mails': mail_list})
+    return jsonify({'status': 'success', 'mails': mail_list, 'next_cursor': next_cursor, 'total': total})
 
 # 获取发件箱邮件列表
 @bp.route('/sent', methods=['GET'])
 def get_sent():
-    user_id = session.get('user_id')
+    user_id = get_current_user_id()
     if not user_id:
         return jsonify({'status': 'error', 'message': '未登录'}), 401
 
-    mails = Mail.query.filter_by(sender_id=user_id).order_by(Mail.sent_at.desc()).all()
+    # mode=summary 时只返回邮件头和正文预览，正文通过 /mail/detail/<id> 按需获取
+    summary = request.args.get('mode') == 'summary'
+    try:
+        rows, next_cursor, total = _mail_page(Mail.sender_id == user_id, summary)
+    except ValueError:
+        return jsonify({'status': 'error', 'message': '分页参数错误'}), 400
+
     mail_list = []
-    for mail in mails:
-        receiver = User.query.get(mail.receiver_id)
-        mail_list.append({
-            'id': mail.id,
-            'receiver': receiver.username,
-            'subject': mail.subject,
-            'content': mail.content,
-            'is_read': mail.is_read,
-            'is_reply': mail.is_reply,
-            'sent_at': mail.sent_at.strftime('%Y-%m-%d %H:%M:%S')
-        })
+    for row in rows:
+        item = _format_mail_row(row, summary)
+        item['receiver'] = row.receiver_name or '未知'
+        mail_list.append(item)
 
-    return jsonify({'status': 'success', 'mails': mail_list})
+    return jsonify({'status': 'success', 'mails': mail_list, 'next_cursor': next_cursor, 'total': total})
 
 # 标记邮件为已读
 @bp.route('/read/<int:mail_id>', methods=['POST'])
 def mark_mail_read(mail_id):
-    user_id = session.get('user_id')
+    user_id = get_current_user_id()
     if not user_id:
         return jsonify({'status': 'error', 'message': '未登录'}), 401
 
@@ -96,16 +184,139 @@ def mark_mail_read(mail_id):
     if mail.receiver_id != user_id:
         return jsonify({'status': 'error', 'message': '无权限标记该邮件为已读'}), 403
 
-    mail.is_read = True
+    _mark_read(user_id, Mail.id == mail_id)
     db.session.commit()
 
     return jsonify({'status': 'success', 'message': '邮件已标记为已读'})
 
+# 批量标记已读：请求体 {"mail_ids": [1, 2, ...]} 或 {"all": true}（收件箱全部标记为已读）
+@bp.route('/read_bulk', methods=['POST'])
+def mark_mails_read():
+    user_id = get_current_user_id()
+    if not user_id:
+        return jsonify({'status': 'error', 'message': '未登录'}), 401
+
+    data = request.get_json(silent=True) or {}
+    if data.get('all'):
+        updated = _mark_read(user_id)
+    else:
+        mail_ids = data.get('mail_ids')
+        if not isinstance(mail_ids, list) or not mail_ids:
+            return jsonify({'status': 'error', 'message': '请指定邮件'}), 400
+        if not all(type(mail_id) is int for mail_id in mail_ids):
+            return jsonify({'status': 'error', 'message': '邮件ID必须是整数'}), 400
+        if len(mail_ids) > MAX_BULK_READ:
+            return jsonify({'status': 'error', 'message': f'单次最多标记 {MAX_BULK_READ} 封邮件'}), 400
+        updated = _mark_read(user_id, Mail.id.in_(mail_ids))
+    db.session.commit()
+
+    return jsonify({'status': 'success', 'message': f'已标记 {updated} 封邮件为已读', 'updated': updated})
+
+# 获取邮件计数（未读数、已被回复的已发邮件数），用于角标显示
+# 客户端定时拉取（按主键读取一行），计数变化后再拉取收件箱；不做长轮询，挂起的请求会占满 gunicorn 的工作线程
+@bp.route('/counters', methods=['GET'])
+def get_mail_counters():
+    user_id = get_current_user_id()
+    if not user_id:
+        return jsonify({'status': 'error', 'message': '未登录'}), 401
+
+    unread, replied = _get_counters(user_id)
+    return jsonify({'status': 'success', 'unread': unread, 'replied': replied})
+
+# 获取邮件详情（含正文），仅发件人或收件人可查看
+@bp.route('/detail/<int:mail_id>', methods=['GET'])
+def get_mail_detail(mail_id):
+    user_id = get_current_user_id()
+    if not user_id:
+        return jsonify({'status': 'error', 'message': '未登录'}), 401
+
+    row = _mail_query(_body_column()).filter(Mail.id == mail_id).first()
+    if not row:
+        return jsonify({'status': 'error', 'message': '邮件不存在'}), 404
+
+    if user_id not in (row.sender_id, row.receiver_id):
+        return jsonify({'status': 'error', 'message': '无权限查看该邮件'}), 403
+
+    mail = _format_mail_row(row, summary=False)
+    mail['sender'] = row.sender_name or '未知'
+    mail['receiver'] = row.receiver_name or '未知'
+    return jsonify({'status': 'success', 'mail': mail})
+
+# 获取会话中的全部邮件（按发送顺序），只返回当前用户收发的邮件；thread_id 取自邮件列表中返回的 thread_id
+@bp.route('/thread/<int:thread_id>', methods=['GET'])
+def get_mail_thread(thread_id):
+    user_id = get_current_user_id()
+    if not user_id:
+        return jsonify({'status': 'error', 'message': '未登录'}), 401
+
+    rows = _mail_query(_body_column()).filter(
+        Mail.thread_id == thread_id,
+        or_(Mail.sender_id == user_id, Mail.receiver_id == user_id)
+    ).order_by(Mail.id).all()
+    if not rows:
+        return jsonify({'status': 'error', 'message': '会话不存在'}), 404
+
+    mails = []
+    for row in rows:
+        item = _format_mail_row(row, summary=False)
+        item['sender'] = row.sender_name or '未知'
+        item['receiver'] = row.receiver_name or '未知'
+        mails.append(item)
+
+    return jsonify({'status': 'success', 'thread_id': thread_id, 'mails': mails})
+
+# 按会话分组的收件箱：每个会话返回最新一封邮件、邮件数和未读数，按最新邮件倒序游标分页
+# 分页在会话索引 mail_thread_index 上进行，邮件数和未读数只统计本页的会话
+@bp.route('/threads', methods=['GET'])
+def get_mail_threads():
+    user_id = get_current_user_id()
+    if not user_id:
+        return jsonify({'status': 'error', 'message': '未登录'}), 401
+
+    threads = db.session.query(
+        MailThreadIndex.thread_id, MailThreadIndex.last_mail_id
+    ).filter(MailThreadIndex.user_id == user_id)
+    try:
+        page, next_cursor, total = keyset_paginate(threads, [MailThreadIndex.last_mail_id])
+    except ValueError:
+        return jsonify({'status': 'error', 'message': '分页参数错误'}), 400
+
+    latest, stats = {}, {}
+    if page:
+        latest = {
+            row.id: row for row in
+            _mail_query(_preview_column()).filter(Mail.id.in_([thread.last_mail_id for thread in page]))
+        }
+        stats = {row.thread_id: row for row in db.session.query(
+            Mail.thread_id,
+            func.count(Mail.id).label('mail_count'),
+            func.sum(case((and_(Mail.receiver_id == user_id, Mail.is_read.is_(False)), 1), else_=0)).label('unread_count')
+        ).filter(
+            Mail.thread_id.in_([thread.thread_id for thread in page]),
+            or_(Mail.sender_id == user_id, Mail.receiver_id == user_id)
+        ).group_by(Mail.thread_id)}
+
+    thread_list = []
+    for thread in page:
+        row = latest[thread.last_mail_id]
+        stat = stats[thread.thread_id]
+        item = _format_mail_row(row, summary=True)
+        item['sender'] = row.sender_name or '未知'
+        item['receiver'] = row.receiver_name or '未知'
+        thread_list.append({
+            'thread_id': thread.thread_id,
+            'mail_count': stat.mail_count,
+            'unread_count': int(stat.unread_count or 0),
+            'latest': item
+        })
+
+    return jsonify({'status': 'success', 'threads': thread_list, 'next_cursor': next_cursor, 'total': total})
+
 # 回复邮件（将原始邮件的 is_reply 设为 True）
 @bp.route('/reply/<int:original_mail_id>', methods=['POST'])
 def reply_mail(original_mail_id):
     data = request.json
-    sender_id = session.get('user_id')
+    sender_id = get_current_user_id()
     content = data.get('content')
 
     if not sender_id:
@@ -131,13 +342,154 @@ def reply_mail(original_mail_id):
         subject=reply_subject,
         content=content,
         is_read=False,  # 新邮件默认未读
-        sent_at=datetime.utcnow()
+        sent_at=datetime.utcnow(),
+        thread_id=original_mail.thread_id or original_mail.id,
+        parent_id=original_mail.id
     )
     
-    # 将原始邮件标记为"已回复"
-    original_mail.is_reply = True
+    # 将原始邮件标记为"已回复"：条件更新，并发回复同一封邮件时只有一个请求增加原发件人的已被回复数
+    replied = db.session.execute(
+        update(Mail).where(Mail.id == original_mail.id, Mail.is_reply.is_(False)).values(is_reply=True),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+    _bump_counters(original_mail.sender_id, unread=1, replied=replied)
     
     db.session.add(new_mail)
+    db.session.flush()
+    _index_thread(new_mail)
     db.session.commit()
 
-    return jsonify({'status': 'success', 'message': '回复邮件发送成功'})
\ No newline at end of file
+    return jsonify({'status': 'success', 'message': '回复邮件发送成功'})
+
+# 辅助函数：把收件箱中符合条件的未读邮件标记为已读，并同步未读计数，返回标记的邮件数
+# 条件更新只统计实际由未读变为已读的邮件，重复标记不会重复扣减
+def _mark_read(user_id, condition=None):
+    stmt = update(Mail).where(Mail.receiver_id == user_id, Mail.is_read.is_(False))
+    if condition is not None:
+        stmt = stmt.where(condition)
+    updated = db.session.execute(stmt.values(is_read=True), execution_options={'synchronize_session': False}).rowcount
+    if updated:
+        _bump_counters(user_id, unread=-updated)
+    return updated
+
+# 辅助函数：把邮件记为发件人和收件人在其会话中的最新邮件（会话索引行不存在时创建）
+def _index_thread(mail):
+    rows = [
+        {'user_id': user_id, 'thread_id': mail.thread_id, 'last_mail_id': mail.id}
+        for user_id in {mail.sender_id, mail.receiver_id}
+    ]
+    if db.session.get_bind().dialect.name == 'mysql':
+        stmt = mysql_insert(MailThreadIndex).values(rows)
+        db.session.execute(stmt.on_duplicate_key_update(
+            last_mail_id=func.greatest(MailThreadIndex.last_mail_id, stmt.inserted.last_mail_id)
+        ))
+        return
+    for row in rows:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(MailThreadIndex).values(row))
+        except IntegrityError:
+            db.session.execute(update(MailThreadIndex).where(
+                MailThreadIndex.user_id == row['user_id'],
+                MailThreadIndex.thread_id == row['thread_id'],
+                MailThreadIndex.last_mail_id < row['last_mail_id']
+            ).values(last_mail_id=row['last_mail_id']))
+
+# 辅助函数：增减用户的邮件计数，与邮件写入在同一事务中；计数行尚未初始化时跳过（首次读取时按邮件表统计）
+def _bump_counters(user_id, unread=0, replied=0):
+    if not unread and not replied:
+        return
+    db.session.execute(update(MailCounter).where(MailCounter.user_id == user_id).values(
+        unread_count=MailCounter.unread_count + unread,
+        replied_count=MailCounter.replied_count + replied
+    ))
+
+# 辅助函数：读取用户的 (未读数, 已被回复数)，计数行不存在时按邮件表统计并保存
+# 统计和插入是同一条 INSERT ... SELECT：MySQL 对统计时读到的邮件加共享锁，并发的发信、回复、标记已读
+# 要么已计入，要么等本事务提交后再更新计数行，不会落在统计和插入之间
+def _get_counters(user_id):
+    counter = db.session.get(MailCounter, user_id, populate_existing=True)
+    if counter:
+        return counter.unread_count, counter.replied_count
+
+    unread = db.select(func.count(Mail.id)).where(
+        Mail.receiver_id == user_id, Mail.is_read.is_(False)
+    ).scalar_subquery()
+    replied = db.select(func.count(Mail.id)).where(
+        Mail.sender_id == user_id, Mail.is_reply.is_(True)
+    ).scalar_subquery()
+    rows = db.select(literal(user_id), unread, replied)
+    columns = ['user_id', 'unread_count', 'replied_count']
+    if db.session.get_bind().dialect.name == 'mysql':
+        stmt = mysql_insert(MailCounter).from_select(columns, rows)
+        # 并发请求已初始化时保留已有的值
+        db.session.execute(stmt.on_duplicate_key_update(unread_count=MailCounter.unread_count))
+    else:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(MailCounter).from_select(columns, rows))
+        except IntegrityError:
+            pass
+    # 加锁读取：读到并发请求刚插入的计数行，而不是本事务开始时的快照
+    counter = db.session.get(MailCounter, user_id, populate_existing=True, with_for_update={'read': True})
+    counts = (counter.unread_count, counter.replied_count)
+    db.session.commit()
+    return counts
+
+# 辅助函数：正文列；群发邮件的正文在 mail_broadcasts 中，需配合 _mail_query 中的关联使用
+def _body_column():
+    return func.coalesce(Mail.content, MailBroadcast.content).label('content')
+
+# 辅助函数：正文预览列，多截一个字符，用于判断是否需要省略号
+def _preview_column():
+    return func.substr(func.coalesce(Mail.content, MailBroadcast.content), 1, PREVIEW_LENGTH + 1).label('preview')
+
+# 辅助函数：查询邮件头字段及指定的正文列，同时关联发件人和收件人用户名、群发邮件正文
+def _mail_query(body_column):
+    sender = aliased(User)
+    receiver = aliased(User)
+    return db.session.query(
+        Mail.id,
+        Mail.sender_id,
+        Mail.receiver_id,
+        Mail.subject,
+        Mail.is_read,
+        Mail.is_reply,
+        Mail.sent_at,
+        Mail.thread_id,
+        Mail.parent_id,
+        body_column,
+        sender.username.label('sender_name'),
+        receiver.username.label('receiver_name')
+    ).outerjoin(
+        sender, Mail.sender_id == sender.id
+    ).outerjoin(
+        receiver, Mail.receiver_id == receiver.id
+    ).outerjoin(
+        MailBroadcast, Mail.broadcast_id == MailBroadcast.id
+    )
+
+# 辅助函数：按 (sent_at, id) 游标分页查询邮件
+# summary 为 True 时不读取完整正文，只截取预览；返回值同 keyset_paginate
+def _mail_page(condition, summary=False):
+    body_column = _preview_column() if summary else _body_column()
+    query = _mail_query(body_column).filter(condition)
+    return keyset_paginate(query, [Mail.sent_at, Mail.id])
+
+# 辅助函数：格式化邮件查询结果（不含发件人/收件人字段）
+def _format_mail_row(row, summary):
+    item = {
+        'id': row.id,
+        'subject': row.subject,
+        'is_read': row.is_read,
+        'is_reply': row.is_reply,
+        'sent_at': row.sent_at,
+        'thread_id': row.thread_id,
+        'parent_id': row.parent_id
+    }
+    if summary:
+        preview = row.preview or ''
+        item['preview'] = preview[:PREVIEW_LENGTH] + '...' if len(preview) > PREVIEW_LENGTH else preview
+    else:
+        item['content'] = row.content
+    return item
\ No newline at end of file
@@ -1,20 +1,33 @@
-# 公告通知管理，可以添加按照部门通知的功能，但是不想加
+# 公告通知管理，公告可以指定发布对象（部门、角色），不指定时全体可见
 # app/routes/notice.py
-from flask import Blueprint, request, jsonify, session
-from app.models import db, Notice, User
+# 已读记录只保存 (用户ID, 公告ID)；每个用户的未读公告数保存在 notice_counters 中，
+# 发布、阅读、删除公告时在同一事务中增减，首页读取未读数只需按主键查一行
+from flask import Blueprint, request, jsonify, Response, current_app
+from app.models import db, Notice, NoticeRead, NoticeCounter, User
+from app.tokens import get_current_user_id
+from app.utils import is_admin, get_user_info, TTLCache, MAX_PAGE_SIZE
+from sqlalchemy import and_, or_, true, update, insert, func
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.exc import IntegrityError
 from datetime import datetime
+import hashlib
 
 bp = Blueprint('notice', __name__, url_prefix='/notice')
 
-# 辅助函数：检查用户是否为管理员
-def is_admin(user_id):
-    user = User.query.get(user_id)
-    return user and user.role == 'admin'
+# 公告摘要的字符数
+PREVIEW_LENGTH = 100
+# 公告列表前几页按发布对象缓存在进程内，发布/删除公告时清空；其他工作进程的缓存在 TTL（秒）后过期
+NOTICE_CACHE_PAGES = 5
+NOTICE_CACHE_SIZE = 1000
+NOTICE_CACHE_TTL = 60
+
+_notice_cache = TTLCache(NOTICE_CACHE_SIZE, NOTICE_CACHE_TTL)
 
 # 1. 发布公告（仅管理员）
+# 可选 department、role 指定发布对象（同时指定时取交集），不指定时全体可见；管理员可以看到所有公告
 @bp.route('/publish', methods=['POST'])
 def publish_notice():
-    user_id = session.get('user_id')
+    user_id = get_current_user_id()
     if not user_id:
         return jsonify({'status': 'error', 'message': '未登录'}), 401
     
@@ -24,18 +37,29 @@ def publish_notice():
     data = request.json
     title = data.get('title')
     content = data.get('content')
+    department = data.get('department') or None
+    role = data.get('role') or None
     
     if not title or not content:
         return jsonify({'status': 'error', 'message': '标题和内容不能为空'}), 400
     
+    if role and role not in ('employee', 'manager', 'admin'):
+        return jsonify({'status': 'error', 'message': '角色只能是 employee、manager 或 admin'}), 400
+    
     new_notice = Notice(
         title=title,
         content=content,
+        preview=_make_preview(content),
+        department=department,
+        role=role,
         created_by=user_id,
         created_at=datetime.utcnow()
     )
     db.session.add(new_notice)
+    # 发布对象的未读数各加 1（一条 UPDATE）
+    _bump_unread(_audience_user_ids(department, role), 1)
     db.session.commit()
+    _notice_cache.invalidate()
     
     return jsonify({
         'status': 'success', 
@@ -46,7 +70,7 @@ def publish_notice():
 # 2. 删除公告（仅管理员）
 @bp.route('/delete/<int:notice_id>', methods=['POST'])
 def delete_notice(notice_id):
-    user_id = session.get('user_id')
+    user_id = get_current_user_id()
     if not user_id:
         return jsonify({'status': 'error', 'message': '未登录'}), 401
     
@@ -57,55 +81,239 @@ def delete_notice(notice_id):
     if not notice:
         return jsonify({'status': 'error', 'message': '公告不存在'}), 404
     
+    # 发布对象中尚未阅读的用户未读数减 1，再删除已读记录
+    readers = db.select(NoticeRead.user_id).where(NoticeRead.notice_id == notice_id)
+    _bump_unread(_audience_user_ids(notice.department, notice.role).where(User.id.not_in(readers)), -1)
+    NoticeRead.query.filter_by(notice_id=notice_id).delete(synchronize_session=False)
     db.session.delete(notice)
     db.session.commit()
+    _notice_cache.invalidate()
     
     return jsonify({'status': 'success', 'message': '公告已删除'})
 
-# 3. 获取公告列表（支持分页）
+# 3. 获取公告列表（支持分页），只返回当前用户可见的公告；登录用户的每条公告带 is_read
+# 前 NOTICE_CACHE_PAGES 页走进程内缓存；响应带 ETag（压缩后为弱 ETag），客户端携带 If-None-Match 且内容未变时返回 304
 @bp.route('/list', methods=['GET'])
 def get_notice_list():
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 10, type=int)
     
-    notices = Notice.query.order_by(Notice.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+    if page < 1 or per_page < 1 or per_page > MAX_PAGE_SIZE:
+        return jsonify({'status': 'error', 'message': '分页参数错误'}), 400
     
-    notice_list = []
-    for notice in notices.items:
-        creator = User.query.get(notice.created_by)
-        notice_list.append({
-            'id': notice.id,
-            'title': notice.title,
-            'content': notice.content[:100] + '...',  # 内容摘要
-            'created_by': creator.username if creator else '未知',
-            'created_at': notice.created_at.strftime('%Y-%m-%d %H:%M:%S')
-        })
+    user_id = get_current_user_id()
+    user = get_user_info(user_id) if user_id else None
     
-    return jsonify({
-        'status': 'success',
-        'total': notices.total,
-        'pages': notices.pages,
-        'current_page': page,
-        'notices': notice_list
-    })
+    # 可见范围相同的用户（同部门同角色、或都是管理员）共用缓存
+    key = _audience_key(user) + (page, per_page)
+    cacheable = page <= NOTICE_CACHE_PAGES
+    cached = _notice_cache.get(key) if cacheable else None
+    if cached is None:
+        payload = _notice_page(user, page, per_page)
+        cached = (payload, hashlib.md5(current_app.json.dumps(payload).encode()).hexdigest())
+        if cacheable:
+            _notice_cache.set(key, cached)
+    payload, etag = cached
+    
+    # 已读状态因人而异，不进入缓存：按本页的公告ID查一次已读记录，并计入 ETag
+    if user:
+        read_ids = _read_notice_ids(user.id, [notice['id'] for notice in payload['notices']])
+        payload = dict(payload, notices=[
+            dict(notice, is_read=notice['id'] in read_ids) for notice in payload['notices']
+        ])
+        etag = hashlib.md5(f'{etag}:{sorted(read_ids)}'.encode()).hexdigest()
+    
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(payload)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
-# 4. 获取公告详情
+# 4. 获取公告详情（不在发布对象中的用户视为公告不存在）
 @bp.route('/detail/<int:notice_id>', methods=['GET'])
 def get_notice_detail(notice_id):
-    notice = Notice.query.get(notice_id)
+    user_id = get_current_user_id()
+    user = get_user_info(user_id) if user_id else None
+    
+    notice = Notice.query.filter(Notice.id == notice_id, visible_condition(user)).first()
     if not notice:
         return jsonify({'status': 'error', 'message': '公告不存在'}), 404
     
-    creator = User.query.get(notice.created_by)
+    creator = get_user_info(notice.created_by)
     return jsonify({
         'status': 'success',
         'notice': {
             'id': notice.id,
             'title': notice.title,
             'content': notice.content,
+            'department': notice.department,
+            'role': notice.role,
             'created_by': creator.username if creator else '未知',
-            'created_at': notice.created_at.strftime('%Y-%m-%d %H:%M:%S')
+            'created_at': notice.created_at
         }
-    })
\ No newline at end of file
+    })
+
+# 5. 标记公告为已读；重复标记不会重复扣减未读数
+@bp.route('/read/<int:notice_id>', methods=['POST'])
+def mark_notice_read(notice_id):
+    user_id = get_current_user_id()
+    if not user_id:
+        return jsonify({'status': 'error', 'message': '未登录'}), 401
+    
+    user = get_user_info(user_id)
+    if not db.session.query(Notice.id).filter(Notice.id == notice_id, visible_condition(user)).first():
+        return jsonify({'status': 'error', 'message': '公告不存在'}), 404
+    
+    try:
+        db.session.add(NoticeRead(user_id=user_id, notice_id=notice_id))
+        db.session.flush()
+    except IntegrityError:
+        # 已读过
+        db.session.rollback()
+        return jsonify({'status': 'success', 'message': '公告已读'})
+    
+    _bump_unread([user_id], -1)
+    db.session.commit()
+    return jsonify({'status': 'success', 'message': '公告已读'})
+
+# 6. 全部标记为已读：一条 INSERT ... SELECT 写入所有未读公告的已读记录，未读数清零
+@bp.route('/read_all', methods=['POST'])
+def mark_all_notices_read():
+    user_id = get_current_user_id()
+    if not user_id:
+        return jsonify({'status': 'error', 'message': '未登录'}), 401
+    
+    user = get_user_info(user_id)
+    readers = db.select(NoticeRead.notice_id).where(NoticeRead.user_id == user_id)
+    result = db.session.execute(insert(NoticeRead).from_select(
+        ['user_id', 'notice_id'],
+        db.select(db.literal(user_id), Notice.id).where(visible_condition(user), Notice.id.not_in(readers))
+    ))
+    db.session.execute(update(NoticeCounter).where(NoticeCounter.user_id == user_id).values(unread_count=0))
+    db.session.commit()
+    
+    return jsonify({'status': 'success', 'message': f'已标记 {result.rowcount} 条公告为已读', 'count': result.rowcount})
+
+# 7. 获取当前用户的未读公告数（首页使用）
+@bp.route('/unread_count', methods=['GET'])
+def get_unread_count():
+    user_id = get_current_user_id()
+    if not user_id:
+        return jsonify({'status': 'error', 'message': '未登录'}), 401
+    
+    return jsonify({'status': 'success', 'unread': _get_unread_count(user_id)})
+
+# 辅助函数：查询一页可见的公告（只读取摘要，关联发布人用户名）
+def _notice_page(user, page, per_page):
+    notices = db.session.query(
+        Notice.id,
+        Notice.title,
+        Notice.preview,
+        Notice.department,
+        Notice.role,
+        Notice.created_at,
+        User.username
+    ).outerjoin(
+        User, Notice.created_by == User.id
+    ).filter(
+        visible_condition(user)
+    ).order_by(
+        Notice.created_at.desc(), Notice.id.desc()
+    ).paginate(page=page, per_page=per_page, error_out=False)
+    
+    return {
+        'status': 'success',
+        'total': notices.total,
+        'pages': notices.pages,
+        'current_page': page,
+        'notices': [{
+            'id': notice.id,
+            'title': notice.title,
+            'content': notice.preview,  # 内容摘要
+            'department': notice.department,
+            'role': notice.role,
+            'created_by': notice.username or '未知',
+            'created_at': notice.created_at
+        } for notice in notices.items]
+    }
+
+# 辅助函数：生成内容摘要
+def _make_preview(content):
+    return content[:PREVIEW_LENGTH] + '...' if len(content) > PREVIEW_LENGTH else content
+
+# 用户可见公告的条件（搜索接口也使用）；管理员可见全部，未登录时只能看到全体公告
+def visible_condition(user):
+    if user and user.role == 'admin':
+        return true()
+    department, role = (user.department, user.role) if user else (None, None)
+    return and_(
+        or_(Notice.department.is_(None), Notice.department == department),
+        or_(Notice.role.is_(None), Notice.role == role)
+    )
+
+# 辅助函数：可见范围的缓存键
+def _audience_key(user):
+    if user and user.role == 'admin':
+        return ('admin',)
+    return (user.department, user.role) if user else (None, None)
+
+# 辅助函数：能看到某条公告的用户ID查询（发布对象和全部管理员），与 visible_condition 保持一致
+def _audience_user_ids(department, role):
+    conditions = []
+    if department:
+        conditions.append(User.department == department)
+    if role:
+        conditions.append(User.role == role)
+    if not conditions:
+        return db.select(User.id)
+    return db.select(User.id).where(or_(and_(*conditions), User.role == 'admin'))
+
+# 辅助函数：增减一批用户的未读数，user_ids 为ID列表或ID查询；计数行尚未初始化的用户跳过（首次读取时统计）
+def _bump_unread(user_ids, delta):
+    db.session.execute(update(NoticeCounter).where(
+        NoticeCounter.user_id.in_(user_ids)
+    ).values(unread_count=NoticeCounter.unread_count + delta))
+
+# 辅助函数：返回 notice_ids 中用户已读的公告ID集合
+def _read_notice_ids(user_id, notice_ids):
+    if not notice_ids:
+        return set()
+    return {row.notice_id for row in db.session.query(NoticeRead.notice_id).filter(
+        NoticeRead.user_id == user_id,
+        NoticeRead.notice_id.in_(notice_ids)
+    )}
+
+# 辅助函数：读取用户的未读公告数，计数行不存在时按公告表和已读记录统计并保存
+# 统计和插入是同一条 INSERT ... SELECT：MySQL 对统计时读到的公告加共享锁，并发发布的公告要么已计入，
+# 要么等本事务提交后再给计数行加 1；发布对象按主库中最新的用户角色、部门计算（加共享锁，修改用户时会删除计数行）
+def _get_unread_count(user_id):
+    counter = db.session.get(NoticeCounter, user_id, populate_existing=True)
+    if counter:
+        return counter.unread_count
+    
+    user = db.session.query(User.role, User.department).filter(
+        User.id == user_id
+    ).with_for_update(read=True).execution_options(use_primary=True).first()
+    readers = db.select(NoticeRead.notice_id).where(NoticeRead.user_id == user_id)
+    unread = db.select(func.count(Notice.id)).where(
+        visible_condition(user), Notice.id.not_in(readers)
+    ).scalar_subquery()
+    rows = db.select(db.literal(user_id), unread)
+    if db.session.get_bind().dialect.name == 'mysql':
+        stmt = mysql_insert(NoticeCounter).from_select(['user_id', 'unread_count'], rows)
+        # 并发请求已初始化时保留已有的值
+        db.session.execute(stmt.on_duplicate_key_update(unread_count=NoticeCounter.unread_count))
+    else:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(NoticeCounter).from_select(['user_id', 'unread_count'], rows))
+        except IntegrityError:
+            pass
+    # 加锁读取：读到并发请求刚插入的计数行，而不是本事务开始时的快照
+    unread_count = db.session.get(
+        NoticeCounter, user_id, populate_existing=True, with_for_update={'read': True}
+    ).unread_count
+    db.session.commit()
+    return unread_count
@@ -1,20 +1,17 @@
 # app/routes/user.py
-from flask import Blueprint, request, jsonify, session
-from app.models import db, User, Project, ProjectMember
-from werkzeug.security import check_password_hash, generate_password_hash
+from flask import Blueprint, request, jsonify
+from app.models import db, User, Project, ProjectMember, NoticeCounter
+from app.tokens import get_current_user_id
+from app.utils import is_admin, invalidate_user
+from app.passwords import hash_password, verify_password
 from datetime import datetime
 
 bp = Blueprint('project', __name__, url_prefix='/project')
 
-# 辅助函数：检查用户是否为管理员
-def is_admin(user_id):
-    user = User.query.get(user_id)
-    return user and user.role == 'admin'
-
 # 1. 获取当前用户信息
 @bp.route('/me', methods=['GET'])
 def get_current_user():
-    user_id = session.get('user_id')
+    user_id = get_current_user_id()
     if not user_id:
         return jsonify({'status': 'error', 'message': '未登录'}), 401
     
@@ -31,7 +28,7 @@ def get_current_user():
             'department': user.department,
             'role': user.role,
             'description': user.description,
-            'created_at': user.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'created_at': user.created_at,
             'projects': _get_user_projects(user_id)  # 通过ProjectMember查询项目
         }
     })
@@ -39,7 +36,7 @@ def get_current_user():
 # 2. 更新当前用户信息
 @bp.route('/update', methods=['POST'])
 def update_user_info():
-    user_id = session.get('user_id')
+    user_id = get_current_user_id()
     if not user_id:
         return jsonify({'status': 'error', 'message': '未登录'}), 401
     
@@ -60,19 +57,21 @@ def update_user_info():
     
     if email:
         user.email = email
-    if department:
+    if department and department != user.department:
         user.department = department
+        _reset_notice_counter(user_id)
     if description:
         user.description = description
     
     db.session.commit()
+    invalidate_user(user_id)
     
     return jsonify({'status': 'success', 'message': '用户信息已更新'})
 
 # 3. 修改密码
 @bp.route('/change_password', methods=['POST'])
 def change_password():
-    user_id = session.get('user_id')
+    user_id = get_current_user_id()
     if not user_id:
         return jsonify({'status': 'error', 'message': '未登录'}), 401
     
@@ -87,12 +86,13 @@ def change_password():
     if not old_password or not new_password:
         return jsonify({'status': 'error', 'message': '请提供旧密码和新密码'}), 400
     
-    # 验证旧密码
-    if not check_password_hash(user.password, old_password):
+    # 验证旧密码（兼容历史明文密码）
+    valid, _ = verify_password(user.password, old_password)
+    if not valid:
         return jsonify({'status': 'error', 'message': '旧密码错误'}), 400
     
     # 更新密码
-    user.password = generate_password_hash(new_password)
+    user.password = hash_password(new_password)
     db.session.commit()
     
     return jsonify({'status': 'success', 'message': '密码已更新'})
@@ -100,7 +100,7 @@ def change_password():
 # 4. 管理员获取用户列表
 @bp.route('/list', methods=['GET'])
 def get_user_list():
-    user_id = session.get('user_id')
+    user_id = get_current_user_id()
     if not user_id:
         return jsonify({'status': 'error', 'message': '未登录'}), 401
     
@@ -122,7 +122,7 @@ def get_user_list():
             'email': user.email,
             'department': user.department,
             'role': user.role,
-            'created_at': user.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'created_at': user.created_at,
             'project_count': project_count
         })
     
@@ -131,7 +131,7 @@ def get_user_list():
 # 5. 管理员获取用户详情
 @bp.route('/detail/<int:user_id>', methods=['GET'])
 def get_user_detail(user_id):
-    current_user_id = session.get('user_id')
+    current_user_id = get_current_user_id()
     if not current_user_id:
         return jsonify({'status': 'error', 'message': '未登录'}), 401
     
@@ -152,7 +152,7 @@ def get_user_detail(user_id):
             'department': user.department,
             'role': user.role,
             'description': user.description,
-            'created_at': user.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'created_at': user.created_at,
             'projects': _get_user_projects(user_id)  # 通过ProjectMember查询项目
         }
     })
@@ -160,7 +160,7 @@ def get_user_detail(user_id):
 # 6. 管理员更新用户信息
 @bp.route('/admin/update/<int:user_id>', methods=['POST'])
 def admin_update_user(user_id):
-    current_user_id = session.get('user_id')
+    current_user_id = get_current_user_id()
     if not current_user_id:
         return jsonify({'status': 'error', 'message': '未登录'}), 401
     
@@ -194,18 +194,26 @@ def admin_update_user(user_id):
         user.username = username
     if email:
         user.email = email
-    if department:
-        user.department = department
     if role:
         # 确保角色是有效的枚举值
         if role not in ['employee', 'manager', 'admin']:
             return jsonify({'status': 'error', 'message': '无效的角色'}), 400
+    if (department and department != user.department) or (role and role != user.role):
+        _reset_notice_counter(user_id)
+    if department:
+        user.department = department
+    if role:
         user.role = role
     
     db.session.commit()
+    invalidate_user(user_id)
     
     return jsonify({'status': 'success', 'message': '用户信息已更新'})
 
+# 辅助函数：部门或角色变化后公告的可见范围随之变化，删除未读计数行，下次读取时重新统计
+def _reset_notice_counter(user_id):
+    NoticeCounter.query.filter_by(user_id=user_id).delete()
+
 # 辅助函数：通过ProjectMember查询用户参与的项目
 def _get_user_projects(user_id):
     projects = []
@@ -220,7 +228,7 @@ def _get_user_projects(user_id):
                 'project_description': project.description,
                 'role': membership.role,
                 'project_creator': project.created_by,
-                'project_created_at': project.created_at.strftime('%Y-%m-%d %H:%M:%S')
+                'project_created_at': project.created_at
             })
     
     return projects
\ No newline at end of file
@@ -1,15 +1,19 @@
  # 报销申请与审批
 # app/routes/reimbursement.py
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, request, jsonify
 from app.models import db, Reimbursement, User, Project
+from app.tokens import get_current_user_id
+from app.replica import read_only
+from app.utils import keyset_paginate, get_user_info, is_admin, statement_timeout
 from datetime import datetime
 from sqlalchemy import or_
+from sqlalchemy.orm import aliased
 
 bp = Blueprint('reimbursement', __name__, url_prefix='/reimbursement')
 
 # 辅助函数：检查用户是否为管理员或项目负责人
 def is_manager_or_admin(user_id, project_id=None):
-    user = User.query.get(user_id)
+    user = get_user_info(user_id)
     if not user:
         return False
     
@@ -27,7 +31,7 @@ def is_manager_or_admin(user_id, project_id=None):
 # 1. 提交报销申请
 @bp.route('/submit', methods=['POST'])
 def submit_reimbursement():
-    user_id = session.get('user_id')
+    user_id = get_current_user_id()
     if not user_id:
         return jsonify({'status': 'error', 'message': '未登录'}), 401
     
@@ -73,55 +77,59 @@ def submit_reimbursement():
 # 2. 获取当前用户的报销记录
 @bp.route('/my_requests', methods=['GET'])
 def get_my_reimbursements():
-    user_id = session.get('user_id')
+    user_id = get_current_user_id()
     if not user_id:
         return jsonify({'status': 'error', 'message': '未登录'}), 401
     
     # 获取用户的所有报销记录，按提交时间降序排列
-    reimbursements = Reimbursement.query.filter_by(user_id=user_id).order_by(
+    reimbursements = _reimbursement_query().filter(
+        Reimbursement.user_id == user_id
+    ).order_by(
         Reimbursement.submitted_at.desc()
     ).all()
     
     return jsonify({
         'status': 'success',
-        'requests': [_format_reimbursement(req) for req in reimbursements]
+        'requests': [_format_reimbursement(*row) for row in reimbursements]
     })
 
 # 3. 获取待审批的报销申请（管理员/项目负责人）
 @bp.route('/pending', methods=['GET'])
 def get_pending_reimbursements():
-    user_id = session.get('user_id')
+    user_id = get_current_user_id()
     if not user_id:
         return jsonify({'status': 'error', 'message': '未登录'}), 401
     
     # 只有管理员或项目负责人可以查看待审批的报销申请
-    user = User.query.get(user_id)
+    user = get_user_info(user_id)
     if not user or (user.role != 'admin' and user.role != 'manager'):
         return jsonify({'status': 'error', 'message': '无权限访问'}), 403
     
     # 管理员可以查看所有待审批的报销
     if user.role == 'admin':
-        pending_requests = Reimbursement.query.filter_by(status='pending').order_by(
+        pending_requests = _reimbursement_query().filter(
+            Reimbursement.status == 'pending'
+        ).order_by(
             Reimbursement.submitted_at.asc()
         ).all()
     else:
         # 经理只能查看自己负责项目的报销
         from app.routes.project import get_user_projects  # 避免循环导入
         managed_projects = [p['project_id'] for p in get_user_projects(user_id) if p['role'] == '负责人']
-        pending_requests = Reimbursement.query.filter(
+        pending_requests = _reimbursement_query().filter(
             Reimbursement.status == 'pending',
             Reimbursement.project_id.in_(managed_projects)
         ).order_by(Reimbursement.submitted_at.asc()).all()
     
     return jsonify({
         'status': 'success',
-        'requests': [_format_reimbursement(req) for req in pending_requests]
+        'requests': [_format_reimbursement(*row) for row in pending_requests]
     })
 
 # 4. 审批报销申请
 @bp.route('/approve/<int:reimbursement_id>', methods=['POST'])
 def approve_reimbursement(reimbursement_id):
-    user_id = session.get('user_id')
+    user_id = get_current_user_id()
     if not user_id:
         return jsonify({'status': 'error', 'message': '未登录'}), 401
     
@@ -160,36 +168,43 @@ def approve_reimbursement(reimbursement_id):
 
 # 5. 获取所有报销记录（管理员）
 @bp.route('/all', methods=['GET'])
+@statement_timeout('report')
+@read_only
 def get_all_reimbursements():
-    user_id = session.get('user_id')
+    user_id = get_current_user_id()
     if not user_id:
         return jsonify({'status': 'error', 'message': '未登录'}), 401
     
     # 只有管理员可以查看所有报销记录
-    user = User.query.get(user_id)
-    if not user or user.role != 'admin':
+    if not is_admin(user_id):
         return jsonify({'status': 'error', 'message': '无权限访问'}), 403
     
-    # 获取所有报销记录，按提交时间降序排列
-    all_requests = Reimbursement.query.order_by(
-        Reimbursement.submitted_at.desc()
-    ).all()
+    # 获取所有报销记录，按提交时间降序游标分页
+    try:
+        all_requests, next_cursor, total = keyset_paginate(
+            _reimbursement_query(), [Reimbursement.submitted_at, Reimbursement.id]
+        )
+    except ValueError:
+        return jsonify({'status': 'error', 'message': '分页参数错误'}), 400
     
     return jsonify({
         'status': 'success',
-        'requests': [_format_reimbursement(req) for req in all_requests]
+        'requests': [_format_reimbursement(*row) for row in all_requests],
+        'next_cursor': next_cursor,
+        'total': total
     })
 
 # 6. 获取单个报销记录详情
 @bp.route('/detail/<int:reimbursement_id>', methods=['GET'])
 def get_reimbursement_detail(reimbursement_id):
-    user_id = session.get('user_id')
+    user_id = get_current_user_id()
     if not user_id:
         return jsonify({'status': 'error', 'message': '未登录'}), 401
     
-    reimbursement = Reimbursement.query.get(reimbursement_id)
-    if not reimbursement:
+    row = _reimbursement_query().filter(Reimbursement.id == reimbursement_id).first()
+    if not row:
         return jsonify({'status': 'error', 'message': '报销申请不存在'}), 404
+    reimbursement = row[0]
     
     # 普通用户只能查看自己的报销记录
     if reimbursement.user_id != user_id and not is_manager_or_admin(user_id):
@@ -197,25 +212,38 @@ def get_reimbursement_detail(reimbursement_id):
     
     return jsonify({
         'status': 'success',
-        'request': _format_reimbursement(reimbursement)
+        'request': _format_reimbursement(*row)
     })
 
-# 辅助函数：格式化报销申请数据
-def _format_reimbursement(req):
-    user = User.query.get(req.user_id)
-    approver = User.query.get(req.approved_by) if req.approved_by else None
-    project = Project.query.get(req.project_id)
-    
+# 辅助函数：构建报销查询，一次性关联申请人、审批人和项目名称（避免逐条查询）
+def _reimbursement_query():
+    applicant = aliased(User)
+    approver = aliased(User)
+    return db.session.query(
+        Reimbursement,
+        applicant.username,
+        approver.username,
+        Project.name
+    ).outerjoin(
+        applicant, Reimbursement.user_id == applicant.id
+    ).outerjoin(
+        approver, Reimbursement.approved_by == approver.id
+    ).outerjoin(
+        Project, Reimbursement.project_id == Project.id
+    )
+
+# 辅助函数：格式化报销申请数据（参数为 _reimbursement_query 返回的一行）
+def _format_reimbursement(req, username=None, approver_name=None, project_name=None):
     return {
         'id': req.id,
         'project_id': req.project_id,
-        'project_name': project.name if project else '未知项目',
+        'project_name': project_name or '未知项目',
         'user_id': req.user_id,
-        'username': user.username if user else '未知',
-        'amount': float(req.amount),  # 转换为浮点数便于前端处理
+        'username': username or '未知',
+        'amount': req.amount,  # Decimal 在序列化时转换为浮点数
         'purpose': req.purpose,
         'status': req.status,
-        'submitted_at': req.submitted_at.strftime('%Y-%m-%d %H:%M:%S'),
-        'approved_by': approver.username if approver else '未审批',
-        'approved_at': req.approved_at.strftime('%Y-%m-%d %H:%M:%S') if req.approved_at else '未审批'
+        'submitted_at': req.submitted_at,
+        'approved_by': approver_name or '未审批',
+        'approved_at': req.approved_at or '未审批'
     }
\ No newline at end of file
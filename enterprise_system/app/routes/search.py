@@ -0,0 +1,135 @@
+# 全文搜索：邮件（主题、正文）、公告（标题、内容）、工作日志（内容）
+# app/routes/search.py
+# MySQL 使用 ngram 分词的 FULLTEXT 索引（支持中文，写入时由 InnoDB 自动维护），按相关度排序；
+# 其他数据库（开发环境）退化为 LIKE 匹配，标题命中的排在前面
+# 权限与各模块一致：邮件只搜索自己收发的，公告只搜索发布对象包含自己的，工作日志只搜索自己的（管理员可搜索全部）
+from flask import Blueprint, request, jsonify
+from app.models import db, Mail, MailBroadcast, Notice, WorkLog
+from app.tokens import get_current_user_id
+from app.replica import read_only
+from app.utils import keyset_paginate, is_admin, get_user_info, statement_timeout
+from app.routes.notice import visible_condition
+from sqlalchemy import Float, String, case, cast, func, literal, or_, type_coerce, union_all
+from sqlalchemy.dialects.mysql import match
+
+bp = Blueprint('search', __name__, url_prefix='/search')
+
+# 可搜索的类型
+SEARCH_TYPES = ('mail', 'notice', 'log')
+# 关键词长度限制（ngram 默认按 2 个字切分，更短的关键词无法命中索引）
+MIN_KEYWORD_LENGTH = 2
+MAX_KEYWORD_LENGTH = 100
+# 搜索结果中正文摘要的长度
+SNIPPET_LENGTH = 100
+
+# 搜索（关键词 q，可选 type=mail,notice,log 限定类型），按相关度降序游标分页
+@bp.route('', methods=['GET'])
+@statement_timeout('report')
+@read_only
+def search():
+    user_id = get_current_user_id()
+    if not user_id:
+        return jsonify({'status': 'error', 'message': '未登录'}), 401
+
+    keyword = (request.args.get('q') or '').strip()
+    if len(keyword) < MIN_KEYWORD_LENGTH:
+        return jsonify({'status': 'error', 'message': f'关键词至少 {MIN_KEYWORD_LENGTH} 个字'}), 400
+    if len(keyword) > MAX_KEYWORD_LENGTH:
+        return jsonify({'status': 'error', 'message': f'关键词不能超过 {MAX_KEYWORD_LENGTH} 个字'}), 400
+
+    types = request.args.get('type')
+    types = types.split(',') if types else SEARCH_TYPES
+    if not all(t in SEARCH_TYPES for t in types):
+        return jsonify({'status': 'error', 'message': '搜索类型只支持 mail、notice、log'}), 400
+
+    searches = {'mail': _search_mails, 'notice': _search_notices, 'log': _search_work_logs}
+    selects = [select for t in dict.fromkeys(types) for select in searches[t](keyword, user_id)]
+    results = (union_all(*selects) if len(selects) > 1 else selects[0]).subquery()
+
+    try:
+        rows, next_cursor, total = keyset_paginate(
+            db.session.query(results),
+            [results.c.score, results.c.doc_type, results.c.doc_id]
+        )
+    except ValueError:
+        return jsonify({'status': 'error', 'message': '分页参数错误'}), 400
+
+    return jsonify({
+        'status': 'success',
+        'results': [_format_result(row) for row in rows],
+        'next_cursor': next_cursor,
+        'total': total
+    })
+
+# 以下各函数返回该类型的查询列表
+# 辅助函数：搜索自己收发的邮件；群发邮件的正文只保存一份，只在收件人一方按群发正文搜索
+def _search_mails(keyword, user_id):
+    condition, score = _match([Mail.subject, Mail.content], keyword)
+    broadcast_condition, broadcast_score = _match([MailBroadcast.subject, MailBroadcast.content], keyword)
+    return [
+        _result_select('mail', Mail.id, Mail.subject, Mail.content, Mail.sent_at, score).where(
+            or_(Mail.sender_id == user_id, Mail.receiver_id == user_id),
+            Mail.broadcast_id.is_(None),
+            condition
+        ),
+        _result_select(
+            'mail', Mail.id, MailBroadcast.subject, MailBroadcast.content, Mail.sent_at, broadcast_score
+        ).join(
+            MailBroadcast, Mail.broadcast_id == MailBroadcast.id
+        ).where(
+            Mail.receiver_id == user_id,
+            broadcast_condition
+        )
+    ]
+
+# 辅助函数：搜索当前用户可见的公告
+def _search_notices(keyword, user_id):
+    condition, score = _match([Notice.title, Notice.content], keyword)
+    return [_result_select('notice', Notice.id, Notice.title, Notice.content, Notice.created_at, score).where(
+        condition, visible_condition(get_user_info(user_id))
+    )]
+
+# 辅助函数：搜索工作日志，标题为日志日期；非管理员只搜索自己的
+def _search_work_logs(keyword, user_id):
+    condition, score = _match([WorkLog.content], keyword)
+    select = _result_select(
+        'log', WorkLog.id, cast(WorkLog.log_date, String), WorkLog.content, WorkLog.created_at, score
+    ).where(condition)
+    if not is_admin(user_id):
+        select = select.where(WorkLog.user_id == user_id)
+    return [select]
+
+# 辅助函数：各类型统一的结果列，正文多截一个字符，用于判断是否需要省略号
+def _result_select(doc_type, id_column, title_column, content_column, time_column, score):
+    return db.select(
+        literal(doc_type, String).label('doc_type'),
+        id_column.label('doc_id'),
+        title_column.label('title'),
+        func.substr(content_column, 1, SNIPPET_LENGTH + 1).label('snippet'),
+        time_column.label('created_at'),
+        score.label('score')
+    )
+
+# 辅助函数：返回 (匹配条件, 相关度)
+# 相关度保留 6 位小数，保证作为分页游标还原后与数据库中的值相等
+def _match(columns, keyword):
+    if db.session.get_bind().dialect.name == 'mysql':
+        condition = match(*columns, against=keyword).in_natural_language_mode()
+        return condition, type_coerce(func.round(condition, 6), Float)
+
+    # 第一列（标题）命中权重 2，其余列命中权重 1
+    hits = [column.contains(keyword, autoescape=True) for column in columns]
+    score = sum(case((hit, 2.0 if i == 0 and len(columns) > 1 else 1.0), else_=0.0) for i, hit in enumerate(hits))
+    return or_(*hits), type_coerce(score, Float)
+
+# 辅助函数：格式化搜索结果
+def _format_result(row):
+    snippet = row.snippet or ''
+    return {
+        'type': row.doc_type,
+        'id': row.doc_id,
+        'title': row.title,
+        'snippet': snippet[:SNIPPET_LENGTH] + '...' if len(snippet) > SNIPPET_LENGTH else snippet,
+        'created_at': row.created_at,
+        'score': row.score
+    }
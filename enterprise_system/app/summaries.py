@@ -0,0 +1,340 @@
+# 月度汇总：按用户、按月保存考勤统计和工作日志时长，统计接口直接读取汇总表，不再逐条扫描明细
+# 明细写入方在一个事务中依次：lock_*_summaries 锁定涉及的汇总行 -> 写入明细 -> refresh_*_summaries 重新计算 -> 提交
+# 锁定使同一用户同一月的并发写入排队，重新计算用加锁读取明细（读到已提交的最新数据），不会互相覆盖；
+# 每人每月最多几十条明细，重新计算代价很小；历史数据用 flask --app run rebuild-summaries 重建（应在低峰期执行）
+# 已结束的月份很少变化，按部门缓存在进程内（SUMMARY_CACHE_TTL 秒）；补录已结束月份的明细时在同一事务中增加该月的版本号
+# （attendance_summary_versions），读取缓存前先查版本号，其他进程的补录提交后缓存即失效
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import insert, update, func, tuple_
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.exc import IntegrityError
+from app.models import db, AttendanceRecord, AttendanceSummary, AttendanceSummaryVersion, WorkLog, WorkLogSummary, User
+from app.utils import TTLCache
+from collections import Counter
+from datetime import date, datetime, time, timedelta
+from itertools import groupby
+import calendar
+
+# 上班时间 9:00，下班时间 18:00
+WORK_START = time(9, 0)
+WORK_END = time(18, 0)
+
+# 已结束月份的部门汇总缓存：最多缓存的 (部门, 年, 月) 数、缓存有效期（秒）
+SUMMARY_CACHE_SIZE = 2048
+SUMMARY_CACHE_TTL = 3600
+
+# 考勤状态对应的汇总字段
+STATUS_FIELDS = {
+    '正常': 'normal_days',
+    '迟到': 'late_days',
+    '早退': 'early_days',
+    '迟到+早退': 'late_early_days',
+    '缺勤': 'absent_days',
+}
+
+_department_cache = TTLCache(SUMMARY_CACHE_SIZE, SUMMARY_CACHE_TTL)
+
+
+# 判断考勤状态
+def attendance_status(check_in, check_out):
+    status = '正常'
+
+    if check_in and check_in > WORK_START:
+        status = '迟到'
+
+    if check_out and check_out < WORK_END:
+        if status == '迟到':
+            status = '迟到+早退'
+        else:
+            status = '早退'
+
+    if not check_in or not check_out:
+        status = '缺勤'
+
+    return status
+
+# 时间转换为当天的秒数，None 记为 -1
+def time_seconds(t):
+    return t.hour * 3600 + t.minute * 60 + t.second if t else -1
+
+# 月份是否已结束
+def is_closed_month(year, month):
+    today = date.today()
+    return (year, month) < (today.year, today.month)
+
+# 月份是否可以缓存：已结束一天以上（月末开始、月份结束后才提交的写入没有增加版本号，不能缓存）
+def _is_cacheable_month(year, month):
+    yesterday = date.today() - timedelta(days=1)
+    return (year, month) < (yesterday.year, yesterday.month)
+
+
+# 月份的第一天和最后一天
+def month_bounds(year, month):
+    return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+
+# 按月份分组：items 为 (用户ID, 日期) 的可迭代对象，返回 {(年, 月): {用户ID, ...}}
+def _group_by_month(items):
+    months = {}
+    for user_id, day in items:
+        months.setdefault((day.year, day.month), set()).add(user_id)
+    return months
+
+# 区间内的 (年, 月)，依次生成
+def _iter_months(first_day, last_day):
+    year, month = first_day.year, first_day.month
+    while (year, month) <= (last_day.year, last_day.month):
+        yield year, month
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+# 锁定汇总行：在写入明细之前调用，items 为 (用户ID, 日期) 的可迭代对象
+# MySQL 用 INSERT ... ON DUPLICATE KEY UPDATE 插入或锁定 (用户, 年, 月) 汇总行，锁持有到事务结束；
+# 所有写入方都先锁汇总行、再写明细，并按 (年, 月, 用户ID) 顺序加锁，避免死锁
+def lock_attendance_summaries(punches):
+    _lock_summaries(AttendanceSummary, punches)
+
+def lock_work_log_summaries(logs):
+    _lock_summaries(WorkLogSummary, logs)
+
+def _lock_summaries(model, items):
+    keys = sorted({(day.year, day.month, user_id) for user_id, day in items})
+    if not keys:
+        return
+    now = datetime.utcnow()
+    rows = [{'user_id': user_id, 'year': year, 'month': month, 'updated_at': now} for year, month, user_id in keys]
+    if _is_mysql():
+        stmt = mysql_insert(model).values(rows)
+        db.session.execute(stmt.on_duplicate_key_update(updated_at=stmt.inserted.updated_at))
+        return
+    # 其他数据库（开发环境）：逐行更新已有汇总行（同样取得写锁），不存在时插入，并发插入时忽略唯一约束冲突
+    for row in rows:
+        updated = db.session.execute(update(model).where(
+            model.user_id == row['user_id'],
+            model.year == row['year'],
+            model.month == row['month']
+        ).values(updated_at=now)).rowcount
+        if not updated:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(insert(model.__table__), row)
+            except IntegrityError:
+                pass
+
+def _is_mysql():
+    return db.session.get_bind().dialect.name == 'mysql'
+
+# 保存某月的汇总行：user_ids 为 None 时（重建）整月替换；
+# 否则汇总行已被 _lock_summaries 锁定，MySQL 上用一条 INSERT ... ON DUPLICATE KEY UPDATE 覆盖，没有明细的汇总行删除
+def _save_month(model, year, month, user_ids, rows):
+    summaries = model.query.filter(model.year == year, model.month == month)
+    if user_ids is not None:
+        summaries = summaries.filter(model.user_id.in_(user_ids))
+    if user_ids is not None and rows and _is_mysql():
+        stmt = mysql_insert(model).values(rows)
+        db.session.execute(stmt.on_duplicate_key_update({
+            key: stmt.inserted[key] for key in rows[0] if key not in ('user_id', 'year', 'month')
+        }))
+        saved = {row['user_id'] for row in rows}
+        if saved != set(user_ids):
+            summaries.filter(model.user_id.not_in(saved)).delete(synchronize_session=False)
+        return
+    summaries.delete(synchronize_session=False)
+    if rows:
+        db.session.execute(insert(model.__table__), rows)
+
+
+# 重新计算考勤汇总：punches 为 (用户ID, 日期) 的可迭代对象，按涉及的月份分组，每个月一次查询；
+# 调用前须已用 lock_attendance_summaries 锁定，由调用方提交事务
+def refresh_attendance_summaries(punches):
+    # 按月份顺序处理，各事务按相同顺序更新版本号行，避免死锁
+    for (year, month), user_ids in sorted(_group_by_month(punches).items()):
+        _refresh_attendance_month(year, month, user_ids)
+
+# 重新计算某月的考勤汇总，user_ids 为 None 时计算所有用户
+def _refresh_attendance_month(year, month, user_ids=None):
+    first_day, last_day = month_bounds(year, month)
+
+    records = db.session.query(
+        AttendanceRecord.user_id,
+        AttendanceRecord.check_in,
+        AttendanceRecord.check_out,
+        AttendanceRecord.note
+    ).filter(AttendanceRecord.date.between(first_day, last_day))
+    if user_ids is not None:
+        # 加锁读取（FOR SHARE）：读到其他事务已提交的最新明细，而不是本事务开始时的快照
+        records = records.filter(AttendanceRecord.user_id.in_(user_ids)).with_for_update(read=True)
+
+    rows = [
+        _summarize(user_id, year, month, list(group))
+        for user_id, group in groupby(
+            records.order_by(AttendanceRecord.user_id, AttendanceRecord.date), key=lambda r: r.user_id
+        )
+    ]
+    _save_month(AttendanceSummary, year, month, user_ids, rows)
+
+    if is_closed_month(year, month):
+        _bump_summary_version(year, month)
+    return len(rows)
+
+# 已结束月份的汇总被修改：在写入方的事务中把该月的版本号加一，提交后各进程读取缓存时发现版本号变化
+def _bump_summary_version(year, month):
+    if _is_mysql():
+        stmt = mysql_insert(AttendanceSummaryVersion).values(year=year, month=month, version=1)
+        db.session.execute(stmt.on_duplicate_key_update(version=AttendanceSummaryVersion.version + 1))
+        return
+    bump = update(AttendanceSummaryVersion).where(
+        AttendanceSummaryVersion.year == year,
+        AttendanceSummaryVersion.month == month
+    ).values(version=AttendanceSummaryVersion.version + 1)
+    if db.session.execute(bump).rowcount:
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.execute(insert(AttendanceSummaryVersion.__table__), {'year': year, 'month': month, 'version': 1})
+    except IntegrityError:
+        db.session.execute(bump)
+
+# 各月份当前的版本号，没有版本号行的月份为 0
+def _summary_versions(months):
+    if not months:
+        return {}
+    rows = db.session.query(
+        AttendanceSummaryVersion.year, AttendanceSummaryVersion.month, AttendanceSummaryVersion.version
+    ).filter(tuple_(AttendanceSummaryVersion.year, AttendanceSummaryVersion.month).in_(months))
+    versions = {(year, month): version for year, month, version in rows}
+    return {key: versions.get(key, 0) for key in months}
+
+# 由一个用户一个月的考勤明细计算汇总行
+def _summarize(user_id, year, month, records):
+    counts = Counter(attendance_status(r.check_in, r.check_out) for r in records)
+    check_ins = [r.check_in for r in records if r.check_in]
+    check_outs = [r.check_out for r in records if r.check_out]
+    row = {
+        'user_id': user_id,
+        'year': year,
+        'month': month,
+        'present_days': len(check_ins),
+        'noted_days': sum(1 for r in records if r.note),
+        'first_check_in': min(check_ins, default=None),
+        'last_check_out': max(check_outs, default=None),
+        'avg_check_in': _average_time(check_ins),
+        'avg_check_out': _average_time(check_outs),
+        'updated_at': datetime.utcnow()
+    }
+    for status, field in STATUS_FIELDS.items():
+        row[field] = counts[status]
+    return row
+
+def _average_time(times):
+    if not times:
+        return None
+    seconds = sum(time_seconds(t) for t in times) // len(times)
+    return time(seconds // 3600, seconds % 3600 // 60, seconds % 60)
+
+
+# 汇总行转换为接口返回的字典
+def format_attendance_summary(summary):
+    result = {'month': f'{summary.year}-{summary.month:02d}', 'present_days': summary.present_days}
+    for field in STATUS_FIELDS.values():
+        result[field] = getattr(summary, field)
+    result['noted_days'] = summary.noted_days
+    for field in ('first_check_in', 'last_check_out', 'avg_check_in', 'avg_check_out'):
+        result[field] = getattr(summary, field)
+    return result
+
+# 获取部门在若干月份的汇总，months 为 (年, 月) 列表，返回 {(年, 月): [含 username 的汇总字典, ...]}
+# 已结束的月份在版本号未变时读缓存，其余月份用一次查询取回
+def department_summaries(department, months):
+    # 先读版本号再读汇总：两次读取之间有补录提交时，缓存的是新数据和旧版本号，下次读取会重新加载
+    versions = _summary_versions([key for key in months if _is_cacheable_month(*key)])
+    result = {}
+    missing = []
+    for key in months:
+        cached = _department_cache.get((department,) + key)
+        if cached is not None and key in versions and cached[0] == versions[key]:
+            result[key] = cached[1]
+        else:
+            missing.append(key)
+
+    if missing:
+        loaded = {key: [] for key in missing}
+        rows = db.session.query(AttendanceSummary, User.username).join(
+            User, AttendanceSummary.user_id == User.id
+        ).filter(
+            User.department == department,
+            tuple_(AttendanceSummary.year, AttendanceSummary.month).in_(missing)
+        ).order_by(AttendanceSummary.year, AttendanceSummary.month, AttendanceSummary.user_id)
+        for summary, username in rows:
+            loaded[(summary.year, summary.month)].append(dict(format_attendance_summary(summary), username=username))
+        for key, items in loaded.items():
+            if key in versions:
+                _department_cache.set((department,) + key, (versions[key], items))
+        result.update(loaded)
+    return result
+
+
+# 重新计算工作日志汇总：logs 为 (用户ID, 日志日期) 的可迭代对象；调用前须已用 lock_work_log_summaries 锁定，由调用方提交事务
+def refresh_work_log_summaries(logs):
+    for (year, month), user_ids in _group_by_month(logs).items():
+        _refresh_work_log_month(year, month, user_ids)
+
+# 重新计算某月的工作日志汇总，user_ids 为 None 时计算所有用户
+def _refresh_work_log_month(year, month, user_ids=None):
+    first_day, last_day = month_bounds(year, month)
+
+    totals = db.session.query(
+        WorkLog.user_id,
+        func.sum(WorkLog.duration_hours).label('total_hours'),
+        func.count(WorkLog.id).label('log_count')
+    ).filter(WorkLog.log_date.between(first_day, last_day))
+    if user_ids is not None:
+        # 加锁读取，同考勤汇总
+        totals = totals.filter(WorkLog.user_id.in_(user_ids)).with_for_update(read=True)
+
+    now = datetime.utcnow()
+    rows = [{
+        'user_id': row.user_id,
+        'year': year,
+        'month': month,
+        'total_hours': row.total_hours,
+        'log_count': row.log_count,
+        'updated_at': now
+    } for row in totals.group_by(WorkLog.user_id)]
+    _save_month(WorkLogSummary, year, month, user_ids, rows)
+    return len(rows)
+
+
+# 重建全部汇总：清空汇总表后逐月计算并提交，返回写入的汇总行数
+def _rebuild(summary_model, date_column, refresh_month):
+    summary_model.query.delete()
+    db.session.commit()
+
+    first_day, last_day = db.session.query(func.min(date_column), func.max(date_column)).one()
+    total = 0
+    if first_day:
+        for year, month in _iter_months(first_day, last_day):
+            total += refresh_month(year, month)
+            db.session.commit()
+    return total
+
+def rebuild_attendance_summaries():
+    total = _rebuild(AttendanceSummary, AttendanceRecord.date, _refresh_attendance_month)
+    # 明细已删除的月份不会重新计算，同样使其缓存失效
+    AttendanceSummaryVersion.query.update(
+        {AttendanceSummaryVersion.version: AttendanceSummaryVersion.version + 1}, synchronize_session=False
+    )
+    db.session.commit()
+    _department_cache.invalidate()
+    return total
+
+def rebuild_work_log_summaries():
+    return _rebuild(WorkLogSummary, WorkLog.log_date, _refresh_work_log_month)
+
+
+@click.command('rebuild-summaries')
+@with_appcontext
+def rebuild_summaries_command():
+    """根据明细重建月度汇总表"""
+    click.echo(f'已重建考勤月度汇总 {rebuild_attendance_summaries()} 条')
+    click.echo(f'已重建工作日志月度汇总 {rebuild_work_log_summaries()} 条')
@@ -0,0 +1,125 @@
+# JWT 令牌认证（可选的无状态模式）
+# 客户端在请求头携带 Authorization: Bearer <access_token> 时，用户ID、角色、部门直接从令牌中读取，
+# 权限检查不再访问数据库；未携带令牌时仍使用原来的 Cookie 会话
+import click
+from flask import request, jsonify, session, g, current_app
+from flask.cli import with_appcontext
+from app.models import db, RevokedToken
+from app.utils import TTLCache
+from datetime import datetime, timedelta
+import threading
+import uuid
+import jwt
+
+JWT_ALGORITHM = 'HS256'
+
+# 本进程内已知吊销的访问令牌 {jti: 过期时间}
+_revoked_access = {}
+_revoked_lock = threading.Lock()
+# 查询吊销表确认未吊销的访问令牌，在本进程内缓存的秒数：其他节点上退出登录的令牌最多在这段时间内仍可使用，
+# 每个令牌每个进程每段时间只查询一次数据库
+REVOCATION_CHECK_TTL = 30
+_unrevoked_access = TTLCache(10000, REVOCATION_CHECK_TTL)
+
+
+# 签发访问令牌和刷新令牌
+def issue_tokens(user):
+    return {
+        'access_token': _encode(user, 'access', current_app.config['JWT_ACCESS_TOKEN_EXPIRES']),
+        'refresh_token': _encode(user, 'refresh', current_app.config['JWT_REFRESH_TOKEN_EXPIRES']),
+        'token_type': 'Bearer',
+        'expires_in': current_app.config['JWT_ACCESS_TOKEN_EXPIRES']
+    }
+
+def _encode(user, token_type, expires_in):
+    now = datetime.utcnow()
+    claims = {
+        'sub': str(user.id),
+        'username': user.username,
+        'role': user.role,
+        'department': user.department,
+        'type': token_type,
+        'jti': uuid.uuid4().hex,
+        'iat': now,
+        'exp': now + timedelta(seconds=expires_in)
+    }
+    return jwt.encode(claims, _secret(), algorithm=JWT_ALGORITHM)
+
+# 校验令牌签名、有效期和类型，返回令牌内容；无效时抛出 jwt.InvalidTokenError
+def decode_token(token, token_type):
+    claims = jwt.decode(token, _secret(), algorithms=[JWT_ALGORITHM])
+    if claims.get('type') != token_type:
+        raise jwt.InvalidTokenError('unexpected token type')
+    return claims
+
+def _secret():
+    return current_app.config.get('JWT_SECRET_KEY') or current_app.secret_key
+
+
+# 吊销令牌：写入吊销表（多节点共享），访问令牌同时记入本进程的吊销列表
+def revoke_token(claims):
+    expires_at = datetime.utcfromtimestamp(claims['exp'])
+    if claims['type'] == 'access':
+        with _revoked_lock:
+            _revoked_access[claims['jti']] = expires_at
+    if not RevokedToken.query.get(claims['jti']):
+        db.session.add(RevokedToken(jti=claims['jti'], expires_at=expires_at))
+
+# 查询吊销表；访问令牌先检查本进程的记录和缓存
+def is_revoked(claims):
+    jti = claims['jti']
+    if claims['type'] != 'access':
+        return db.session.get(RevokedToken, jti) is not None
+
+    with _revoked_lock:
+        if jti in _revoked_access:
+            return True
+    if _unrevoked_access.get(jti):
+        return False
+    revoked = db.session.get(RevokedToken, jti)
+    if revoked:
+        with _revoked_lock:
+            _revoked_access[jti] = revoked.expires_at
+        return True
+    _unrevoked_access.set(jti, True)
+    return False
+
+# 清理已过期的吊销记录
+def purge_revoked_tokens():
+    now = datetime.utcnow()
+    with _revoked_lock:
+        for jti in [jti for jti, expires_at in _revoked_access.items() if expires_at <= now]:
+            del _revoked_access[jti]
+    deleted = RevokedToken.query.filter(RevokedToken.expires_at <= now).delete()
+    db.session.commit()
+    return deleted
+
+@click.command('purge-revoked-tokens')
+@with_appcontext
+def purge_revoked_tokens_command():
+    """清理已过期的令牌吊销记录（建议每天定时执行）"""
+    click.echo(f'已清理过期吊销记录 {purge_revoked_tokens()} 条')
+
+
+# 请求前钩子：解析 Bearer 令牌，校验通过后放入 g.token_claims
+def load_token_claims():
+    header = request.headers.get('Authorization', '')
+    if not header.startswith('Bearer '):
+        return None
+    try:
+        claims = decode_token(header[len('Bearer '):].strip(), 'access')
+    except jwt.ExpiredSignatureError:
+        return jsonify({'status': 'error', 'message': '令牌已过期'}), 401
+    except jwt.InvalidTokenError:
+        return jsonify({'status': 'error', 'message': '令牌无效'}), 401
+    if is_revoked(claims):
+        return jsonify({'status': 'error', 'message': '令牌已失效'}), 401
+    g.token_claims = claims
+    return None
+
+# 获取当前登录用户ID：优先使用 Bearer 令牌，其次使用 Cookie 会话
+def get_current_user_id():
+    claims = g.get('token_claims')
+    if claims:
+        return int(claims['sub'])
+    return session.get('user_id')
@@ -29,8 +29,9 @@ CREATE TABLE `attendance_records`  (
   `check_out` time(0) NULL DEFAULT NULL,
   `note` text CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci NULL,
   PRIMARY KEY (`id`) USING BTREE,
+  UNIQUE INDEX `uq_attendance_user_date`(`user_id`, `date`) USING BTREE,
   INDEX `user_id`(`user_id`) USING BTREE
-) ENGINE = MyISAM AUTO_INCREMENT = 5 CHARACTER SET = utf8mb4 COLLATE = utf8mb4_general_ci ROW_FORMAT = Dynamic;
+) ENGINE = InnoDB AUTO_INCREMENT = 5 CHARACTER SET = utf8mb4 COLLATE = utf8mb4_general_ci ROW_FORMAT = Dynamic;
 
 -- ----------------------------
 -- Records of attendance_records
@@ -40,6 +41,56 @@ INSERT INTO `attendance_records` VALUES (2, 2, '2025-05-10', '09:05:00', '17:55:
 INSERT INTO `attendance_records` VALUES (3, 3, '2025-05-10', '09:00:00', '19:00:00', '企业顾问咨询会议');
 INSERT INTO `attendance_records` VALUES (4, 6, '2025-06-01', '22:39:36', '22:39:52', NULL);
 
+-- ----------------------------
+-- Table structure for attendance_summaries
+-- ----------------------------
+DROP TABLE IF EXISTS `attendance_summaries`;
+CREATE TABLE `attendance_summaries`  (
+  `id` int(11) NOT NULL AUTO_INCREMENT,
+  `user_id` int(11) NOT NULL,
+  `year` smallint(6) NOT NULL,
+  `month` smallint(6) NOT NULL,
+  `present_days` int(11) NULL DEFAULT 0,
+  `normal_days` int(11) NULL DEFAULT 0,
+  `late_days` int(11) NULL DEFAULT 0,
+  `early_days` int(11) NULL DEFAULT 0,
+  `late_early_days` int(11) NULL DEFAULT 0,
+  `absent_days` int(11) NULL DEFAULT 0,
+  `noted_days` int(11) NULL DEFAULT 0,
+  `first_check_in` time(0) NULL DEFAULT NULL,
+  `last_check_out` time(0) NULL DEFAULT NULL,
+  `avg_check_in` time(0) NULL DEFAULT NULL,
+  `avg_check_out` time(0) NULL DEFAULT NULL,
+  `updated_at` datetime(0) NULL DEFAULT NULL,
+  PRIMARY KEY (`id`) USING BTREE,
+  UNIQUE INDEX `uq_attendance_summary_user_month`(`user_id`, `year`, `month`) USING BTREE,
+  INDEX `idx_attendance_summary_month`(`year`, `month`) USING BTREE,
+  CONSTRAINT `attendance_summaries_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE RESTRICT ON UPDATE RESTRICT
+) ENGINE = InnoDB AUTO_INCREMENT = 5 CHARACTER SET = utf8mb4 COLLATE = utf8mb4_general_ci ROW_FORMAT = Dynamic;
+
+-- ----------------------------
+-- Records of attendance_summaries
+-- ----------------------------
+INSERT INTO `attendance_summaries` VALUES (1, 1, 2025, 5, 1, 1, 0, 0, 0, 0, 1, '09:00:00', '18:00:00', '09:00:00', '18:00:00', '2025-06-02 15:21:32');
+INSERT INTO `attendance_summaries` VALUES (2, 2, 2025, 5, 1, 0, 0, 0, 1, 0, 1, '09:05:00', '17:55:00', '09:05:00', '17:55:00', '2025-06-02 15:21:32');
+INSERT INTO `attendance_summaries` VALUES (3, 3, 2025, 5, 1, 1, 0, 0, 0, 0, 1, '09:00:00', '19:00:00', '09:00:00', '19:00:00', '2025-06-02 15:21:32');
+INSERT INTO `attendance_summaries` VALUES (4, 6, 2025, 6, 1, 0, 1, 0, 0, 0, 0, '22:39:36', '22:39:52', '22:39:36', '22:39:52', '2025-06-02 15:21:32');
+
+-- ----------------------------
+-- Table structure for attendance_summary_versions
+-- ----------------------------
+DROP TABLE IF EXISTS `attendance_summary_versions`;
+CREATE TABLE `attendance_summary_versions`  (
+  `year` smallint(6) NOT NULL,
+  `month` smallint(6) NOT NULL,
+  `version` int(11) NOT NULL DEFAULT 0,
+  PRIMARY KEY (`year`, `month`) USING BTREE
+) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_general_ci ROW_FORMAT = Dynamic;
+
+-- ----------------------------
+-- Records of attendance_summary_versions
+-- ----------------------------
+
 -- ----------------------------
 -- Table structure for leave_requests
 -- ----------------------------
@@ -57,8 +108,10 @@ CREATE TABLE `leave_requests`  (
   `approved_at` timestamp(0) NULL DEFAULT NULL,
   PRIMARY KEY (`id`) USING BTREE,
   INDEX `user_id`(`user_id`) USING BTREE,
-  INDEX `approved_by`(`approved_by`) USING BTREE
-) ENGINE = MyISAM AUTO_INCREMENT = 3 CHARACTER SET = utf8mb4 COLLATE = utf8mb4_general_ci ROW_FORMAT = Dynamic;
+  INDEX `approved_by`(`approved_by`) USING BTREE,
+  INDEX `idx_leave_status_submitted`(`status`, `submitted_at`) USING BTREE,
+  INDEX `idx_leave_submitted_id`(`submitted_at`, `id`) USING BTREE
+) ENGINE = InnoDB AUTO_INCREMENT = 3 CHARACTER SET = utf8mb4 COLLATE = utf8mb4_general_ci ROW_FORMAT = Dynamic;
 
 -- ----------------------------
 -- Records of leave_requests
@@ -66,6 +119,75 @@ CREATE TABLE `leave_requests`  (
 INSERT INTO `leave_requests` VALUES (1, 2, '事假', '2025-05-05', '2025-05-06', '家中有事需请假两日', 'approved', '2025-05-17 14:21:20', 3, '2025-05-17 14:21:20');
 INSERT INTO `leave_requests` VALUES (2, 1, '病假', '2025-05-08', '2025-05-09', '突发感冒', 'approved', '2025-05-17 14:21:20', 6, '2025-06-02 06:45:15');
 
+-- ----------------------------
+-- Table structure for mail_broadcasts
+-- ----------------------------
+DROP TABLE IF EXISTS `mail_broadcasts`;
+CREATE TABLE `mail_broadcasts`  (
+  `id` int(11) NOT NULL AUTO_INCREMENT,
+  `sender_id` int(11) NULL DEFAULT NULL,
+  `subject` varchar(200) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci NULL DEFAULT NULL,
+  `content` text CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci NULL,
+  `department` varchar(100) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci NULL DEFAULT NULL,
+  `role` varchar(20) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci NULL DEFAULT NULL,
+  `recipient_count` int(11) NULL DEFAULT 0,
+  `sent_at` datetime(0) NULL DEFAULT NULL,
+  PRIMARY KEY (`id`) USING BTREE,
+  INDEX `sender_id`(`sender_id`) USING BTREE,
+  FULLTEXT INDEX `ft_mail_broadcasts_subject_content`(`subject`, `content`) WITH PARSER `ngram`,
+  CONSTRAINT `mail_broadcasts_ibfk_1` FOREIGN KEY (`sender_id`) REFERENCES `users` (`id`) ON DELETE RESTRICT ON UPDATE RESTRICT
+) ENGINE = InnoDB AUTO_INCREMENT = 1 CHARACTER SET = utf8mb4 COLLATE = utf8mb4_general_ci ROW_FORMAT = Dynamic;
+
+-- ----------------------------
+-- Records of mail_broadcasts
+-- ----------------------------
+
+-- ----------------------------
+-- Table structure for mail_counters
+-- ----------------------------
+DROP TABLE IF EXISTS `mail_counters`;
+CREATE TABLE `mail_counters`  (
+  `user_id` int(11) NOT NULL,
+  `unread_count` int(11) NOT NULL DEFAULT 0,
+  `replied_count` int(11) NOT NULL DEFAULT 0,
+  PRIMARY KEY (`user_id`) USING BTREE,
+  CONSTRAINT `mail_counters_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE RESTRICT ON UPDATE RESTRICT
+) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_general_ci ROW_FORMAT = Dynamic;
+
+-- ----------------------------
+-- Records of mail_counters
+-- ----------------------------
+
+-- ----------------------------
+-- Table structure for mail_thread_index
+-- ----------------------------
+DROP TABLE IF EXISTS `mail_thread_index`;
+CREATE TABLE `mail_thread_index`  (
+  `user_id` int(11) NOT NULL,
+  `thread_id` int(11) NOT NULL,
+  `last_mail_id` int(11) NOT NULL,
+  PRIMARY KEY (`user_id`, `thread_id`) USING BTREE,
+  INDEX `idx_mail_thread_index_user_last`(`user_id`, `last_mail_id`) USING BTREE,
+  CONSTRAINT `mail_thread_index_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE RESTRICT ON UPDATE RESTRICT
+) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_general_ci ROW_FORMAT = Dynamic;
+
+-- ----------------------------
+-- Records of mail_thread_index
+-- ----------------------------
+INSERT INTO `mail_thread_index` VALUES (1, 1, 1);
+INSERT INTO `mail_thread_index` VALUES (1, 2, 2);
+INSERT INTO `mail_thread_index` VALUES (1, 5, 5);
+INSERT INTO `mail_thread_index` VALUES (1, 6, 6);
+INSERT INTO `mail_thread_index` VALUES (2, 1, 1);
+INSERT INTO `mail_thread_index` VALUES (2, 2, 2);
+INSERT INTO `mail_thread_index` VALUES (3, 3, 3);
+INSERT INTO `mail_thread_index` VALUES (4, 3, 3);
+INSERT INTO `mail_thread_index` VALUES (6, 4, 4);
+INSERT INTO `mail_thread_index` VALUES (6, 5, 5);
+INSERT INTO `mail_thread_index` VALUES (6, 6, 6);
+INSERT INTO `mail_thread_index` VALUES (6, 7, 7);
+INSERT INTO `mail_thread_index` VALUES (6, 9, 9);
+
 -- ----------------------------
 -- Table structure for mails
 -- ----------------------------
@@ -79,22 +201,65 @@ CREATE TABLE `mails`  (
   `is_read` tinyint(1) NULL DEFAULT 0,
   `is_reply` tinyint(1) NULL DEFAULT 0,
   `sent_at` timestamp(0) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  `broadcast_id` int(11) NULL DEFAULT NULL,
+  `thread_id` int(11) NULL DEFAULT NULL,
+  `parent_id` int(11) NULL DEFAULT NULL,
   PRIMARY KEY (`id`) USING BTREE,
   INDEX `sender_id`(`sender_id`) USING BTREE,
-  INDEX `receiver_id`(`receiver_id`) USING BTREE
-) ENGINE = MyISAM AUTO_INCREMENT = 10 CHARACTER SET = utf8mb4 COLLATE = utf8mb4_general_ci ROW_FORMAT = Dynamic;
+  INDEX `receiver_id`(`receiver_id`) USING BTREE,
+  INDEX `idx_mails_receiver_sent`(`receiver_id`, `sent_at`) USING BTREE,
+  INDEX `idx_mails_sender_sent`(`sender_id`, `sent_at`) USING BTREE,
+  INDEX `fk_mails_broadcast`(`broadcast_id`) USING BTREE,
+  INDEX `fk_mails_parent`(`parent_id`) USING BTREE,
+  INDEX `idx_mails_thread`(`thread_id`) USING BTREE,
+  FULLTEXT INDEX `ft_mails_subject_content`(`subject`, `content`) WITH PARSER `ngram`,
+  CONSTRAINT `fk_mails_broadcast` FOREIGN KEY (`broadcast_id`) REFERENCES `mail_broadcasts` (`id`) ON DELETE RESTRICT ON UPDATE RESTRICT,
+  CONSTRAINT `fk_mails_parent` FOREIGN KEY (`parent_id`) REFERENCES `mails` (`id`) ON DELETE RESTRICT ON UPDATE RESTRICT
+) ENGINE = InnoDB AUTO_INCREMENT = 10 CHARACTER SET = utf8mb4 COLLATE = utf8mb4_general_ci ROW_FORMAT = Dynamic;
 
 -- ----------------------------
 -- Records of mails
 -- ----------------------------
-INSERT INTO `mails` VALUES (1, 2, 1, '证据材料整理完成', '已整理张三案相关证据清单，请查收并准备交叉询问提纲。', 0, 0, '2025-05-17 14:21:20');
-INSERT INTO `mails` VALUES (2, 1, 2, '收到，谢谢', '好的，我这边会在今天下午完成提纲准备。', 0, 1, '2025-05-17 14:21:20');
-INSERT INTO `mails` VALUES (3, 3, 4, '顾问服务合同归档', '请将已签订的科技公司顾问合同扫描并归档至系统。', 0, 0, '2025-05-17 14:21:20');
-INSERT INTO `mails` VALUES (4, 6, 6, '测试邮件', '这是一封测试邮件', 0, 0, '2025-06-01 13:39:48');
-INSERT INTO `mails` VALUES (5, 6, 1, '测试邮件', '这是一封测试邮件', 0, 0, '2025-06-01 13:39:54');
-INSERT INTO `mails` VALUES (6, 6, 1, '测试邮', '这是一封测试邮件', 0, 0, '2025-06-01 13:40:01');
-INSERT INTO `mails` VALUES (7, 6, 6, '第二封自己发给自己的测试邮件', '这是一封测试邮件', 1, 1, '2025-06-01 13:46:43');
-INSERT INTO `mails` VALUES (9, 6, 6, 'Re: 第二封自己发给自己的测试邮件', '收到测试，谢谢！', 0, 0, '2025-06-01 14:11:54');
+INSERT INTO `mails` VALUES (1, 2, 1, '证据材料整理完成', '已整理张三案相关证据清单，请查收并准备交叉询问提纲。', 0, 0, '2025-05-17 14:21:20', NULL, 1, NULL);
+INSERT INTO `mails` VALUES (2, 1, 2, '收到，谢谢', '好的，我这边会在今天下午完成提纲准备。', 0, 1, '2025-05-17 14:21:20', NULL, 2, NULL);
+INSERT INTO `mails` VALUES (3, 3, 4, '顾问服务合同归档', '请将已签订的科技公司顾问合同扫描并归档至系统。', 0, 0, '2025-05-17 14:21:20', NULL, 3, NULL);
+INSERT INTO `mails` VALUES (4, 6, 6, '测试邮件', '这是一封测试邮件', 0, 0, '2025-06-01 13:39:48', NULL, 4, NULL);
+INSERT INTO `mails` VALUES (5, 6, 1, '测试邮件', '这是一封测试邮件', 0, 0, '2025-06-01 13:39:54', NULL, 5, NULL);
+INSERT INTO `mails` VALUES (6, 6, 1, '测试邮', '这是一封测试邮件', 0, 0, '2025-06-01 13:40:01', NULL, 6, NULL);
+INSERT INTO `mails` VALUES (7, 6, 6, '第二封自己发给自己的测试邮件', '这是一封测试邮件', 1, 1, '2025-06-01 13:46:43', NULL, 7, NULL);
+INSERT INTO `mails` VALUES (9, 6, 6, 'Re: 第二封自己发给自己的测试邮件', '收到测试，谢谢！', 0, 0, '2025-06-01 14:11:54', NULL, 9, NULL);
+
+-- ----------------------------
+-- Table structure for notice_counters
+-- ----------------------------
+DROP TABLE IF EXISTS `notice_counters`;
+CREATE TABLE `notice_counters`  (
+  `user_id` int(11) NOT NULL,
+  `unread_count` int(11) NOT NULL DEFAULT 0,
+  PRIMARY KEY (`user_id`) USING BTREE,
+  CONSTRAINT `notice_counters_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE RESTRICT ON UPDATE RESTRICT
+) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_general_ci ROW_FORMAT = Dynamic;
+
+-- ----------------------------
+-- Records of notice_counters
+-- ----------------------------
+
+-- ----------------------------
+-- Table structure for notice_reads
+-- ----------------------------
+DROP TABLE IF EXISTS `notice_reads`;
+CREATE TABLE `notice_reads`  (
+  `user_id` int(11) NOT NULL,
+  `notice_id` int(11) NOT NULL,
+  PRIMARY KEY (`user_id`, `notice_id`) USING BTREE,
+  INDEX `notice_id`(`notice_id`) USING BTREE,
+  CONSTRAINT `notice_reads_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE RESTRICT ON UPDATE RESTRICT,
+  CONSTRAINT `notice_reads_ibfk_2` FOREIGN KEY (`notice_id`) REFERENCES `notices` (`id`) ON DELETE RESTRICT ON UPDATE RESTRICT
+) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_general_ci ROW_FORMAT = Dynamic;
+
+-- ----------------------------
+-- Records of notice_reads
+-- ----------------------------
 
 -- ----------------------------
 -- Table structure for notices
@@ -104,18 +269,23 @@ CREATE TABLE `notices`  (
   `id` int(11) NOT NULL AUTO_INCREMENT,
   `title` varchar(200) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci NULL DEFAULT NULL,
   `content` text CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci NULL,
+  `preview` varchar(120) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci NULL DEFAULT NULL,
+  `department` varchar(100) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci NULL DEFAULT NULL,
+  `role` varchar(20) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci NULL DEFAULT NULL,
   `created_by` int(11) NULL DEFAULT NULL,
   `created_at` timestamp(0) NOT NULL DEFAULT CURRENT_TIMESTAMP,
   PRIMARY KEY (`id`) USING BTREE,
-  INDEX `created_by`(`created_by`) USING BTREE
-) ENGINE = MyISAM AUTO_INCREMENT = 4 CHARACTER SET = utf8mb4 COLLATE = utf8mb4_general_ci ROW_FORMAT = Dynamic;
+  INDEX `created_by`(`created_by`) USING BTREE,
+  INDEX `idx_notices_created`(`created_at`) USING BTREE,
+  FULLTEXT INDEX `ft_notices_title_content`(`title`, `content`) WITH PARSER `ngram`
+) ENGINE = InnoDB AUTO_INCREMENT = 4 CHARACTER SET = utf8mb4 COLLATE = utf8mb4_general_ci ROW_FORMAT = Dynamic;
 
 -- ----------------------------
 -- Records of notices
 -- ----------------------------
-INSERT INTO `notices` VALUES (1, '关于“五一”假期安排', '本所将于5月1日至5月3日放假，5月4日恢复办公，请各位律师提前协调案件安排。', 5, '2025-05-17 14:21:20');
-INSERT INTO `notices` VALUES (2, '新员工入职流程更新', '为提高入职效率，新增线上文档系统，请于5月10日前学习完毕。', 5, '2025-05-17 14:21:20');
-INSERT INTO `notices` VALUES (3, '[全体员工]系统升级通知', '本周五晚20:00-24:00进行系统升级，期间暂停服务...', 6, '2025-06-01 14:33:23');
+INSERT INTO `notices` VALUES (1, '关于“五一”假期安排', '本所将于5月1日至5月3日放假，5月4日恢复办公，请各位律师提前协调案件安排。', '本所将于5月1日至5月3日放假，5月4日恢复办公，请各位律师提前协调案件安排。', NULL, NULL, 5, '2025-05-17 14:21:20');
+INSERT INTO `notices` VALUES (2, '新员工入职流程更新', '为提高入职效率，新增线上文档系统，请于5月10日前学习完毕。', '为提高入职效率，新增线上文档系统，请于5月10日前学习完毕。', NULL, NULL, 5, '2025-05-17 14:21:20');
+INSERT INTO `notices` VALUES (3, '[全体员工]系统升级通知', '本周五晚20:00-24:00进行系统升级，期间暂停服务...', '本周五晚20:00-24:00进行系统升级，期间暂停服务...', NULL, NULL, 6, '2025-06-01 14:33:23');
 
 -- ----------------------------
 -- Table structure for project_members
@@ -129,7 +299,7 @@ CREATE TABLE `project_members`  (
   PRIMARY KEY (`id`) USING BTREE,
   INDEX `project_id`(`project_id`) USING BTREE,
   INDEX `user_id`(`user_id`) USING BTREE
-) ENGINE = MyISAM AUTO_INCREMENT = 6 CHARACTER SET = utf8mb4 COLLATE = utf8mb4_general_ci ROW_FORMAT = Dynamic;
+) ENGINE = InnoDB AUTO_INCREMENT = 6 CHARACTER SET = utf8mb4 COLLATE = utf8mb4_general_ci ROW_FORMAT = Dynamic;
 
 -- ----------------------------
 -- Records of project_members
@@ -152,7 +322,7 @@ CREATE TABLE `projects`  (
   `created_at` timestamp(0) NOT NULL DEFAULT CURRENT_TIMESTAMP,
   PRIMARY KEY (`id`) USING BTREE,
   INDEX `created_by`(`created_by`) USING BTREE
-) ENGINE = MyISAM AUTO_INCREMENT = 3 CHARACTER SET = utf8mb4 COLLATE = utf8mb4_general_ci ROW_FORMAT = Dynamic;
+) ENGINE = InnoDB AUTO_INCREMENT = 3 CHARACTER SET = utf8mb4 COLLATE = utf8mb4_general_ci ROW_FORMAT = Dynamic;
 
 -- ----------------------------
 -- Records of projects
@@ -177,8 +347,10 @@ CREATE TABLE `reimbursements`  (
   PRIMARY KEY (`id`) USING BTREE,
   INDEX `project_id`(`project_id`) USING BTREE,
   INDEX `user_id`(`user_id`) USING BTREE,
-  INDEX `approved_by`(`approved_by`) USING BTREE
-) ENGINE = MyISAM AUTO_INCREMENT = 4 CHARACTER SET = utf8mb4 COLLATE = utf8mb4_general_ci ROW_FORMAT = Dynamic;
+  INDEX `approved_by`(`approved_by`) USING BTREE,
+  INDEX `idx_reimbursements_status_submitted`(`status`, `submitted_at`) USING BTREE,
+  INDEX `idx_reimbursements_submitted_id`(`submitted_at`, `id`) USING BTREE
+) ENGINE = InnoDB AUTO_INCREMENT = 4 CHARACTER SET = utf8mb4 COLLATE = utf8mb4_general_ci ROW_FORMAT = Dynamic;
 
 -- ----------------------------
 -- Records of reimbursements
@@ -187,6 +359,51 @@ INSERT INTO `reimbursements` VALUES (1, 1, 1, 560.00, '前往法院的交通与
 INSERT INTO `reimbursements` VALUES (2, 2, 4, 200.00, '打印顾问服务材料', 'approved', '2025-05-17 14:21:20', 6, '2025-06-02 06:51:59');
 INSERT INTO `reimbursements` VALUES (3, 1, 6, 1250.50, '项目差旅费', 'pending', '2025-06-02 06:52:54', NULL, NULL);
 
+-- ----------------------------
+-- Table structure for revoked_tokens
+-- ----------------------------
+DROP TABLE IF EXISTS `revoked_tokens`;
+CREATE TABLE `revoked_tokens`  (
+  `jti` varchar(32) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci NOT NULL,
+  `expires_at` datetime(0) NOT NULL,
+  PRIMARY KEY (`jti`) USING BTREE,
+  INDEX `ix_revoked_tokens_expires_at`(`expires_at`) USING BTREE
+) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_general_ci ROW_FORMAT = Dynamic;
+
+-- ----------------------------
+-- Records of revoked_tokens
+-- ----------------------------
+
+-- ----------------------------
+-- Table structure for schema_migrations
+-- ----------------------------
+DROP TABLE IF EXISTS `schema_migrations`;
+CREATE TABLE `schema_migrations`  (
+  `version` int(11) NOT NULL,
+  `description` varchar(200) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci NULL DEFAULT NULL,
+  `applied_at` timestamp(0) NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (`version`) USING BTREE
+) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_general_ci ROW_FORMAT = Dynamic;
+
+-- ----------------------------
+-- Records of schema_migrations
+-- ----------------------------
+INSERT INTO `schema_migrations` VALUES (1, '所有表转换为 InnoDB', '2025-06-02 15:21:32');
+INSERT INTO `schema_migrations` VALUES (2, '添加复合索引和考勤唯一索引', '2025-06-02 15:21:32');
+INSERT INTO `schema_migrations` VALUES (3, '创建 revoked_tokens 表', '2025-06-02 15:21:32');
+INSERT INTO `schema_migrations` VALUES (4, '创建 attendance_summaries 表', '2025-06-02 15:21:32');
+INSERT INTO `schema_migrations` VALUES (5, '创建 work_log_summaries 表', '2025-06-02 15:21:32');
+INSERT INTO `schema_migrations` VALUES (6, '添加全文搜索索引', '2025-06-02 15:21:32');
+INSERT INTO `schema_migrations` VALUES (7, '创建 mail_counters 表', '2025-06-02 15:21:32');
+INSERT INTO `schema_migrations` VALUES (8, '创建 mail_broadcasts 表，mails 添加 broadcast_id', '2025-06-02 15:21:32');
+INSERT INTO `schema_migrations` VALUES (9, 'mails 添加 thread_id、parent_id', '2025-06-02 15:21:32');
+INSERT INTO `schema_migrations` VALUES (10, 'notices 添加 preview 和发布时间索引', '2025-06-02 15:21:32');
+INSERT INTO `schema_migrations` VALUES (11, 'notices 添加发布对象，创建 notice_reads、notice_counters 表', '2025-06-02 15:21:32');
+INSERT INTO `schema_migrations` VALUES (12, 'users.password 加长为 VARCHAR(255)', '2025-06-02 15:21:32');
+INSERT INTO `schema_migrations` VALUES (13, '添加游标分页排序键索引', '2025-06-02 15:21:32');
+INSERT INTO `schema_migrations` VALUES (14, '创建 mail_thread_index 表并回填', '2025-06-02 15:21:32');
+INSERT INTO `schema_migrations` VALUES (15, '创建 attendance_summary_versions 表', '2025-06-02 15:21:32');
+
 -- ----------------------------
 -- Table structure for users
 -- ----------------------------
@@ -194,7 +411,7 @@ DROP TABLE IF EXISTS `users`;
 CREATE TABLE `users`  (
   `id` int(11) NOT NULL AUTO_INCREMENT,
   `username` varchar(50) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci NOT NULL,
-  `password` varchar(100) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci NOT NULL,
+  `password` varchar(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci NOT NULL,
   `email` varchar(100) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci NULL DEFAULT NULL,
   `department` varchar(100) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci NULL DEFAULT NULL,
   `role` enum('employee','manager','admin') CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci NULL DEFAULT 'employee',
@@ -203,7 +420,7 @@ CREATE TABLE `users`  (
   PRIMARY KEY (`id`) USING BTREE,
   UNIQUE INDEX `username`(`username`) USING BTREE,
   UNIQUE INDEX `email`(`email`) USING BTREE
-) ENGINE = MyISAM AUTO_INCREMENT = 7 CHARACTER SET = utf8mb4 COLLATE = utf8mb4_general_ci ROW_FORMAT = Dynamic;
+) ENGINE = InnoDB AUTO_INCREMENT = 7 CHARACTER SET = utf8mb4 COLLATE = utf8mb4_general_ci ROW_FORMAT = Dynamic;
 
 -- ----------------------------
 -- Records of users
@@ -215,6 +432,32 @@ INSERT INTO `users` VALUES (4, '刘原', '123456', 'liu.yan@lawfirm.com', '行
 INSERT INTO `users` VALUES (5, 'admin', 'admin123', 'admin@lawfirm.com', '系统管理', 'admin', '系统维护人员，管理权限与账号', '2025-05-17 14:21:20');
 INSERT INTO `users` VALUES (6, 'testman', '123456', 'alice@example.com', '研发部', 'admin', NULL, '2025-06-01 13:11:52');
 
+-- ----------------------------
+-- Table structure for work_log_summaries
+-- ----------------------------
+DROP TABLE IF EXISTS `work_log_summaries`;
+CREATE TABLE `work_log_summaries`  (
+  `id` int(11) NOT NULL AUTO_INCREMENT,
+  `user_id` int(11) NOT NULL,
+  `year` smallint(6) NOT NULL,
+  `month` smallint(6) NOT NULL,
+  `total_hours` decimal(8, 2) NULL DEFAULT 0.00,
+  `log_count` int(11) NULL DEFAULT 0,
+  `updated_at` datetime(0) NULL DEFAULT NULL,
+  PRIMARY KEY (`id`) USING BTREE,
+  UNIQUE INDEX `uq_work_log_summary_user_month`(`user_id`, `year`, `month`) USING BTREE,
+  INDEX `idx_work_log_summary_month`(`year`, `month`) USING BTREE,
+  CONSTRAINT `work_log_summaries_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE RESTRICT ON UPDATE RESTRICT
+) ENGINE = InnoDB AUTO_INCREMENT = 5 CHARACTER SET = utf8mb4 COLLATE = utf8mb4_general_ci ROW_FORMAT = Dynamic;
+
+-- ----------------------------
+-- Records of work_log_summaries
+-- ----------------------------
+INSERT INTO `work_log_summaries` VALUES (1, 1, 2025, 5, 8.00, 1, '2025-06-02 15:21:32');
+INSERT INTO `work_log_summaries` VALUES (2, 2, 2025, 5, 7.50, 1, '2025-06-02 15:21:32');
+INSERT INTO `work_log_summaries` VALUES (3, 3, 2025, 5, 9.00, 1, '2025-06-02 15:21:32');
+INSERT INTO `work_log_summaries` VALUES (4, 6, 2025, 6, 8.50, 1, '2025-06-02 15:21:32');
+
 -- ----------------------------
 -- Table structure for work_logs
 -- ----------------------------
@@ -227,8 +470,11 @@ CREATE TABLE `work_logs`  (
   `content` text CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci NULL,
   `created_at` timestamp(0) NOT NULL DEFAULT CURRENT_TIMESTAMP,
   PRIMARY KEY (`id`) USING BTREE,
-  INDEX `user_id`(`user_id`) USING BTREE
-) ENGINE = MyISAM AUTO_INCREMENT = 5 CHARACTER SET = utf8mb4 COLLATE = utf8mb4_general_ci ROW_FORMAT = Dynamic;
+  INDEX `user_id`(`user_id`) USING BTREE,
+  INDEX `idx_work_logs_user_date`(`user_id`, `log_date`) USING BTREE,
+  INDEX `idx_work_logs_date_id`(`log_date`, `id`) USING BTREE,
+  FULLTEXT INDEX `ft_work_logs_content`(`content`) WITH PARSER `ngram`
+) ENGINE = InnoDB AUTO_INCREMENT = 5 CHARACTER SET = utf8mb4 COLLATE = utf8mb4_general_ci ROW_FORMAT = Dynamic;
 
 -- ----------------------------
 -- Records of work_logs
@@ -7,7 +7,7 @@ USE class_project;
 CREATE TABLE users (
     id INT PRIMARY KEY AUTO_INCREMENT,
     username VARCHAR(50) NOT NULL UNIQUE,
-    password VARCHAR(100) NOT NULL,
+    password VARCHAR(255) NOT NULL,
     email VARCHAR(100) UNIQUE,
     department VARCHAR(100),
     role ENUM('employee', 'manager', 'admin') DEFAULT 'employee',
@@ -15,6 +15,20 @@ CREATE TABLE users (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- 群发邮件（正文只保存一份，收件人各有一行 mails 记录）
+CREATE TABLE mail_broadcasts (
+    id INT PRIMARY KEY AUTO_INCREMENT,
+    sender_id INT,
+    subject VARCHAR(200),
+    content TEXT,
+    department VARCHAR(100),
+    role VARCHAR(20),
+    recipient_count INT DEFAULT 0,
+    sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (sender_id) REFERENCES users(id),
+    FULLTEXT INDEX ft_mail_broadcasts_subject_content (subject, content) WITH PARSER ngram
+);
+
 -- 邮件表
 CREATE TABLE mails (
     id INT PRIMARY KEY AUTO_INCREMENT,
@@ -25,8 +39,17 @@ CREATE TABLE mails (
     is_read BOOLEAN DEFAULT FALSE,
     is_reply BOOLEAN DEFAULT FALSE,
     sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    broadcast_id INT NULL,
+    thread_id INT,
+    parent_id INT NULL,
     FOREIGN KEY (sender_id) REFERENCES users(id),
-    FOREIGN KEY (receiver_id) REFERENCES users(id)
+    FOREIGN KEY (receiver_id) REFERENCES users(id),
+    FOREIGN KEY (broadcast_id) REFERENCES mail_broadcasts(id),
+    FOREIGN KEY (parent_id) REFERENCES mails(id),
+    INDEX idx_mails_thread (thread_id),
+    INDEX idx_mails_receiver_sent (receiver_id, sent_at),
+    INDEX idx_mails_sender_sent (sender_id, sent_at),
+    FULLTEXT INDEX ft_mails_subject_content (subject, content) WITH PARSER ngram
 );
 
 -- 公告通知
@@ -34,9 +57,14 @@ CREATE TABLE notices (
     id INT PRIMARY KEY AUTO_INCREMENT,
     title VARCHAR(200),
     content TEXT,
+    preview VARCHAR(120),
+    department VARCHAR(100),
+    role VARCHAR(20),
     created_by INT,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (created_by) REFERENCES users(id)
+    FOREIGN KEY (created_by) REFERENCES users(id),
+    INDEX idx_notices_created (created_at),
+    FULLTEXT INDEX ft_notices_title_content (title, content) WITH PARSER ngram
 );
 
 -- 项目表
@@ -72,7 +100,9 @@ CREATE TABLE reimbursements (
     approved_at TIMESTAMP NULL,
     FOREIGN KEY (project_id) REFERENCES projects(id),
     FOREIGN KEY (user_id) REFERENCES users(id),
-    FOREIGN KEY (approved_by) REFERENCES users(id)
+    FOREIGN KEY (approved_by) REFERENCES users(id),
+    INDEX idx_reimbursements_status_submitted (status, submitted_at),
+    INDEX idx_reimbursements_submitted_id (submitted_at, id)
 );
 
 -- 请假申请表
@@ -88,7 +118,9 @@ CREATE TABLE leave_requests (
     approved_by INT,
     approved_at TIMESTAMP NULL,
     FOREIGN KEY (user_id) REFERENCES users(id),
-    FOREIGN KEY (approved_by) REFERENCES users(id)
+    FOREIGN KEY (approved_by) REFERENCES users(id),
+    INDEX idx_leave_status_submitted (status, submitted_at),
+    INDEX idx_leave_submitted_id (submitted_at, id)
 );
 
 -- 考勤记录（可扩展迟到等字段）
@@ -99,7 +131,8 @@ CREATE TABLE attendance_records (
     check_in TIME,
     check_out TIME,
     note TEXT,
-    FOREIGN KEY (user_id) REFERENCES users(id)
+    FOREIGN KEY (user_id) REFERENCES users(id),
+    UNIQUE KEY uq_attendance_user_date (user_id, date)
 );
 
 -- 工作日志
@@ -110,5 +143,118 @@ CREATE TABLE work_logs (
     duration_hours DECIMAL(4,2),
     content TEXT,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users(id),
+    INDEX idx_work_logs_user_date (user_id, log_date),
+    INDEX idx_work_logs_date_id (log_date, id),
+    FULLTEXT INDEX ft_work_logs_content (content) WITH PARSER ngram
+);
+
+-- 考勤月度汇总（由考勤明细计算，flask --app run rebuild-summaries 可重建）
+CREATE TABLE attendance_summaries (
+    id INT PRIMARY KEY AUTO_INCREMENT,
+    user_id INT NOT NULL,
+    year SMALLINT NOT NULL,
+    month SMALLINT NOT NULL,
+    present_days INT DEFAULT 0,
+    normal_days INT DEFAULT 0,
+    late_days INT DEFAULT 0,
+    early_days INT DEFAULT 0,
+    late_early_days INT DEFAULT 0,
+    absent_days INT DEFAULT 0,
+    noted_days INT DEFAULT 0,
+    first_check_in TIME,
+    last_check_out TIME,
+    avg_check_in TIME,
+    avg_check_out TIME,
+    updated_at DATETIME,
+    FOREIGN KEY (user_id) REFERENCES users(id),
+    UNIQUE KEY uq_attendance_summary_user_month (user_id, year, month),
+    INDEX idx_attendance_summary_month (year, month)
+);
+
+-- 已结束月份考勤汇总的版本号（补录时加一，各进程据此使部门汇总缓存失效）
+CREATE TABLE attendance_summary_versions (
+    year SMALLINT NOT NULL,
+    month SMALLINT NOT NULL,
+    version INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (year, month)
+);
+
+-- 工作日志月度汇总（由工作日志计算，flask --app run rebuild-summaries 可重建）
+CREATE TABLE work_log_summaries (
+    id INT PRIMARY KEY AUTO_INCREMENT,
+    user_id INT NOT NULL,
+    year SMALLINT NOT NULL,
+    month SMALLINT NOT NULL,
+    total_hours DECIMAL(8,2) DEFAULT 0,
+    log_count INT DEFAULT 0,
+    updated_at DATETIME,
+    FOREIGN KEY (user_id) REFERENCES users(id),
+    UNIQUE KEY uq_work_log_summary_user_month (user_id, year, month),
+    INDEX idx_work_log_summary_month (year, month)
+);
+
+-- 邮件计数（未读数、已被回复数；首次读取时按邮件表初始化）
+CREATE TABLE mail_counters (
+    user_id INT PRIMARY KEY,
+    unread_count INT NOT NULL DEFAULT 0,
+    replied_count INT NOT NULL DEFAULT 0,
+    FOREIGN KEY (user_id) REFERENCES users(id)
+);
+
+-- 邮件会话索引（每个用户参与的每个会话一行，记录最新邮件ID）
+CREATE TABLE mail_thread_index (
+    user_id INT NOT NULL,
+    thread_id INT NOT NULL,
+    last_mail_id INT NOT NULL,
+    PRIMARY KEY (user_id, thread_id),
+    FOREIGN KEY (user_id) REFERENCES users(id),
+    INDEX idx_mail_thread_index_user_last (user_id, last_mail_id)
+);
+
+-- 公告已读记录
+CREATE TABLE notice_reads (
+    user_id INT NOT NULL,
+    notice_id INT NOT NULL,
+    PRIMARY KEY (user_id, notice_id),
+    FOREIGN KEY (user_id) REFERENCES users(id),
+    FOREIGN KEY (notice_id) REFERENCES notices(id)
+);
+
+-- 每个用户的未读公告数
+CREATE TABLE notice_counters (
+    user_id INT PRIMARY KEY,
+    unread_count INT NOT NULL DEFAULT 0,
     FOREIGN KEY (user_id) REFERENCES users(id)
 );
+
+-- 已吊销的 JWT 令牌（退出登录、刷新令牌轮换）
+CREATE TABLE revoked_tokens (
+    jti VARCHAR(32) PRIMARY KEY,
+    expires_at DATETIME NOT NULL,
+    INDEX ix_revoked_tokens_expires_at (expires_at)
+);
+
+-- 已执行的数据库迁移（本文件已包含 app/migrate.py 中全部迁移的结果；新增迁移时同步修改建表语句并在此追加版本）
+CREATE TABLE schema_migrations (
+    version INT PRIMARY KEY,
+    description VARCHAR(200),
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO schema_migrations (version, description) VALUES
+(1, '所有表转换为 InnoDB'),
+(2, '添加复合索引和考勤唯一索引'),
+(3, '创建 revoked_tokens 表'),
+(4, '创建 attendance_summaries 表'),
+(5, '创建 work_log_summaries 表'),
+(6, '添加全文搜索索引'),
+(7, '创建 mail_counters 表'),
+(8, '创建 mail_broadcasts 表，mails 添加 broadcast_id'),
+(9, 'mails 添加 thread_id、parent_id'),
+(10, 'notices 添加 preview 和发布时间索引'),
+(11, 'notices 添加发布对象，创建 notice_reads、notice_counters 表'),
+(12, 'users.password 加长为 VARCHAR(255)'),
+(13, '添加游标分页排序键索引'),
+(14, '创建 mail_thread_index 表并回填'),
+(15, '创建 attendance_summary_versions 表');
@@ -0,0 +1,19 @@
+# gunicorn 配置，各项参数可用环境变量覆盖
+# 每个工作进程有独立的数据库连接池，进程数 x (DB_POOL_SIZE + DB_MAX_OVERFLOW) 不应超过 MySQL 的 max_connections
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS', 4))
+timeout = int(os.environ.get('WEB_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+# 定期重启工作进程，防止内存缓慢增长
+max_requests = 2000
+max_requests_jitter = 200
+# 先加载应用再 fork，减少内存占用；连接池在各进程首次使用时才建立连接
+preload_app = True
+accesslog = '-'
+errorlog = '-'
@@ -3,4 +3,5 @@ from app import create_app
 app = create_app()
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    # 开发服务器，生产环境使用 wsgi.py（gunicorn -c gunicorn.conf.py wsgi:app）
+    app.run(debug=app.config['DEBUG'])
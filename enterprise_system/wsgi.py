@@ -0,0 +1,5 @@
+# 生产环境 WSGI 入口：gunicorn -c gunicorn.conf.py wsgi:app
+import os
+from app import create_app
+
+app = create_app(os.environ.get('FLASK_CONFIG', 'production'))